@@ -0,0 +1,52 @@
+"""Mide la búsqueda en active_playlist con PlaylistSearch.
+
+Uso: python benchmarks/bench_playlist_search.py [n ...]
+Construye el índice sobre n pistas y cronometra cada pulsación de varias búsquedas,
+una ampliación de 1000 pistas y el borrado de una fila.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymusic import PlaylistSearch, Track, search_keys  # noqa: E402
+
+
+def fake_tracks(n):
+    for i in range(n):
+        artist, album, track = i // 240, (i // 12) % 20, i % 12
+        yield Track.from_path(f"/musica/Artista {artist:05d}/Álbum {album:02d} (2009)/{track + 1:02d} - Canción número {i}.flac")
+
+
+def per_keystroke(search, query, origin):
+    # Igual que la interfaz: cada pulsación continúa desde la coincidencia anterior
+    worst, row = 0.0, origin
+    for n in range(1, len(query) + 1):
+        started = time.perf_counter()
+        if row is not None: row = search.find(query[:n], row)
+        worst = max(worst, time.perf_counter() - started)
+    return worst
+
+
+def main(sizes):
+    print(f"{'pistas':>10} {'índice (ms)':>12} {'peor tecla (ms)':>16} {'sin resultado (ms)':>19} {'+1000 (ms)':>11} {'borrar (ms)':>12}")
+    for n in sizes:
+        tracks = list(fake_tracks(n))
+        started = time.perf_counter()
+        search = PlaylistSearch(search_keys(tracks), tracks)
+        build = time.perf_counter() - started
+        worst = max(per_keystroke(search, q, n // 2) for q in (f"numero {n - 7}", "album 07", "CANCIÓN"))
+        started = time.perf_counter()
+        search.find("no existe", n // 2)
+        miss = time.perf_counter() - started
+        started = time.perf_counter()
+        search.extend(search_keys(tracks[:1000]))
+        extend = time.perf_counter() - started
+        started = time.perf_counter()
+        search.remove(n // 2)
+        remove = time.perf_counter() - started
+        print(f"{n:>10} {build * 1000:>12.1f} {worst * 1000:>16.3f} {miss * 1000:>19.3f} {extend * 1000:>11.2f} {remove * 1000:>12.3f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,47 @@
+"""Mide la memoria de active_playlist con dicts frente a Track.
+
+Uso: python benchmarks/bench_track_memory.py [n ...]
+Simula una biblioteca de 12 pistas por álbum y 20 álbumes por artista.
+"""
+import gc
+import os
+import sys
+import tracemalloc
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymusic import Track  # noqa: E402
+
+
+def fake_paths(n):
+    for i in range(n):
+        artist, album, track = i // 240, (i // 12) % 20, i % 12
+        yield f"/musica/Artista {artist:05d}/Álbum {album:02d} (2009)/{track + 1:02d} - Canción número {i}.flac"
+
+
+def as_dict(path):
+    decoded = urllib.parse.unquote(path)
+    parts = decoded.rstrip('/').split('/')
+    return {'name': parts[-1], 'path': path, 'album': parts[-2] if len(parts) > 1 else "-"}
+
+
+def measure(factory, n):
+    gc.collect()
+    tracemalloc.start()
+    playlist = [factory(p) for p in fake_paths(n)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del playlist
+    return current
+
+
+def main(sizes):
+    print(f"{'pistas':>10} {'dict (MiB)':>12} {'Track (MiB)':>12} {'ahorro':>8}")
+    for n in sizes:
+        d = measure(as_dict, n)
+        t = measure(Track.from_path, n)
+        print(f"{n:>10} {d / 2**20:>12.1f} {t / 2**20:>12.1f} {100 * (1 - t / d):>7.0f}%")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,355 @@
+"""Prueba de resistencia: CmusApp sin terminal contra un WebDAV local durante miles de acciones.
+
+Uso: python benchmarks/soak.py [--iterations 5000] [--sample-every 250] [--report soak.json]
+                               [--max-rss-mib 64] [--max-threads 4] [--max-traced-mib 32] [--max-latency-growth 1.5]
+
+Arranca un servidor WebDAV mínimo (http.server) sobre una biblioteca sintética en un
+directorio temporal, sustituye mpv por un reproductor simulado y maneja la interfaz con
+el pilot de Textual: reproducir, saltar, cargar álbumes y listas, encolar y buscar.
+Cada --sample-every acciones anota RSS, hilos de pymusic (sin los del servidor), memoria
+trazada y latencia de las cargas.
+El crecimiento se mide desde el final del calentamiento (10% de las acciones): RSS, hilos
+y memoria trazada en valor absoluto, y la latencia comparando la mediana de cada tipo de
+carga en la primera y la segunda mitad. Si se supera algún presupuesto termina con código 1.
+"""
+import argparse
+import asyncio
+import email.utils
+import gc
+import http.server
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import urllib.parse
+from xml.sax.saxutils import escape
+
+
+# --- MPV SIMULADO ---
+class FakeMPV:
+    """Lo que AudioPlayer usa de python-mpv; cada pista 'suena' TRACK_SECONDS segundos."""
+    TRACK_SECONDS = 3.0
+
+    def __init__(self, *args, **kwargs):
+        self.props = {}
+        self.observers = {}
+        self.pause = False
+        self.volume = 80
+        self.duration = None
+        self._started = None
+
+    def __setitem__(self, key, value): self.props[key] = value
+
+    def observe_property(self, name, handler): self.observers[name] = handler
+
+    def play(self, url):
+        self.duration = self.TRACK_SECONDS
+        self._started = time.monotonic()
+        handler = self.observers.get('cache-speed')
+        if handler: handler('cache-speed', random.uniform(1, 8) * 1048576)
+
+    def stop(self): self._started = None
+
+    def terminate(self): self._started = None
+
+    @property
+    def time_pos(self):
+        if self._started is None: return None
+        return min(time.monotonic() - self._started, self.duration)
+
+    @time_pos.setter
+    def time_pos(self, value):
+        if self._started is not None: self._started = time.monotonic() - value
+
+    @property
+    def core_idle(self):
+        return self._started is None or self.time_pos >= self.duration
+
+
+sys.modules['mpv'] = types.SimpleNamespace(MPV=FakeMPV)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pymusic  # noqa: E402
+from textual.widgets import DataTable  # noqa: E402
+
+
+# --- WEBDAV LOCAL ---
+class DavHandler(http.server.BaseHTTPRequestHandler):
+    """PROPFIND (Depth 0/1), GET/HEAD con Range y PUT sobre un directorio."""
+    protocol_version = 'HTTP/1.1'
+    # Cabeceras y cuerpo van en escrituras separadas: sin esto Nagle añade ~40 ms por petición
+    disable_nagle_algorithm = True
+    root = None
+
+    def log_message(self, *args): pass
+
+    def _local(self):
+        return os.path.join(self.root, urllib.parse.unquote(urllib.parse.urlparse(self.path).path).lstrip('/'))
+
+    def _send(self, code, body=b"", headers=()):
+        self.send_response(code)
+        for key, value in headers: self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD': self.wfile.write(body)
+
+    @staticmethod
+    def _etag(st):
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+    def _entry(self, href, local):
+        st = os.stat(local)
+        stamp = email.utils.formatdate(st.st_mtime, usegmt=True)
+        if os.path.isdir(local):
+            props = "<d:resourcetype><d:collection/></d:resourcetype>"
+        else:
+            props = f"<d:resourcetype/><d:getcontentlength>{st.st_size}</d:getcontentlength><d:getetag>{escape(self._etag(st))}</d:getetag>"
+        return (f"<d:response><d:href>{escape(urllib.parse.quote(href))}</d:href><d:propstat><d:prop>{props}"
+                f"<d:getlastmodified>{stamp}</d:getlastmodified></d:prop></d:propstat></d:response>")
+
+    def do_PROPFIND(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        local = self._local()
+        if not os.path.exists(local): return self._send(404)
+        href = urllib.parse.unquote(urllib.parse.urlparse(self.path).path)
+        parts = [self._entry(href, local)]
+        if os.path.isdir(local) and self.headers.get('Depth', '1') != '0':
+            base = href.rstrip('/') + '/'
+            for name in sorted(os.listdir(local)):
+                child = os.path.join(local, name)
+                parts.append(self._entry(base + name + ('/' if os.path.isdir(child) else ''), child))
+        body = f'<?xml version="1.0"?><d:multistatus xmlns:d="DAV:">{"".join(parts)}</d:multistatus>'.encode('utf-8')
+        self._send(207, body, [('Content-Type', 'application/xml; charset=utf-8')])
+
+    def do_GET(self):
+        local = self._local()
+        if not os.path.isfile(local): return self._send(404)
+        with open(local, 'rb') as f: data = f.read()
+        etag = self._etag(os.stat(local))
+        if self.headers.get('If-None-Match') == etag: return self._send(304, headers=[('ETag', etag)])
+        rng = self.headers.get('Range', '')
+        if rng.startswith('bytes=') and self.headers.get('If-Range', etag) == etag:
+            start, _, end = rng[6:].partition('-')
+            start, end = int(start), int(end) if end else len(data) - 1
+            return self._send(206, data[start:end + 1], [('ETag', etag), ('Content-Range', f"bytes {start}-{end}/{len(data)}")])
+        self._send(200, data, [('ETag', etag)])
+
+    do_HEAD = do_GET
+
+    def do_PUT(self):
+        local = self._local()
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        tmp = local + '.tmp'
+        with open(tmp, 'wb') as f: f.write(data)
+        os.replace(tmp, local)
+        self._send(201, headers=[('ETag', self._etag(os.stat(local)))])
+
+
+class DavServer(http.server.ThreadingHTTPServer):
+    """Cada conexión en un hilo 'dav-…': así el recuento de hilos solo incluye los de pymusic."""
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        threading.Thread(target=self.process_request_thread, args=(request, client_address),
+                         daemon=True, name=f"dav-{client_address[1]}").start()
+
+
+def pymusic_threads():
+    return sum(not t.name.startswith('dav') for t in threading.enumerate())
+
+
+def build_library(root, artists, albums, tracks):
+    music = os.path.join(root, 'musica')
+    album_paths, all_tracks = [], []
+    for a in range(artists):
+        for b in range(albums):
+            rel = f"Artista {a:03d}/Álbum {b:02d} ({2000 + b})"
+            os.makedirs(os.path.join(music, rel))
+            album_paths.append(f"/musica/{rel}/")
+            for t in range(tracks):
+                name = f"{t + 1:02d} - Canción {a}-{b}-{t}.mp3"
+                with open(os.path.join(music, rel, name), 'wb') as f: f.write(b"\0" * 64)
+                all_tracks.append(f"{rel}/{name}")
+    lists = os.path.join(music, 'listas')
+    os.makedirs(lists)
+    playlists = []
+    for n, size in enumerate((50, 500, 5000)):
+        path = os.path.join(lists, f"mezcla {n}.m3u")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("#EXTM3U\n" + "\n".join(random.choice(all_tracks) for _ in range(size)) + "\n")
+        playlists.append((f"/musica/listas/mezcla {n}.m3u", size))
+    return album_paths, tracks, playlists
+
+
+# --- MEDIDAS ---
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Sin /proc solo hay máximo histórico (KiB en Linux, bytes en macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values, q):
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def wait_for(pilot, condition, timeout=10.0):
+    started = time.monotonic()
+    while not condition():
+        if time.monotonic() - started > timeout: return None
+        await pilot.pause(0.005)
+    return time.monotonic() - started
+
+
+async def soak(args, conf, albums, tracks_per_album, playlists):
+    rng = random.Random(args.seed)
+    samples, latencies, window, timeouts = [], {}, [], 0
+    warmup = max(1, args.iterations // 10)
+    baseline = None
+
+    app = pymusic.CmusApp(conf)
+    async with app.run_test(size=(120, 40)) as pilot:
+        table = app.query_one(DataTable)
+
+        async def load(kind, start, expected):
+            nonlocal timeouts
+            app.active_playlist = []
+            start()
+            elapsed = await wait_for(pilot, lambda: len(app.active_playlist) == expected)
+            if elapsed is None: timeouts += 1
+            else:
+                latencies.setdefault(kind, []).append((i, elapsed * 1000))
+                window.append(elapsed * 1000)
+
+        async def album():
+            path = rng.choice(albums)
+            await load('album', lambda: app.add_tracks_recursive(path, True), tracks_per_album)
+
+        async def playlist():
+            path, size = rng.choice(playlists)
+            await load(f'playlist {size}', lambda: app.load_playlist_content(path), size)
+
+        async def play():
+            if app.active_playlist: app.play_index(rng.randrange(len(app.active_playlist)))
+
+        async def skip():
+            table.focus()
+            await pilot.press(rng.choice(['b', 'b', 'z']))
+
+        async def enqueue():
+            table.focus()
+            await pilot.press('c')
+
+        async def search():
+            table.focus()
+            query = rng.choice(["can", "01", "artista 0", "zzz"])
+            await pilot.press('/', *[c if c != ' ' else 'space' for c in query], 'enter')
+
+        actions = [(album, 3), (playlist, 1), (play, 6), (skip, 6), (enqueue, 2), (search, 2)]
+        population, weights = zip(*actions)
+        started = time.monotonic()
+        for i in range(1, args.iterations + 1):
+            await rng.choices(population, weights)[0]()
+            await pilot.pause(0)
+            if i % args.sample_every and i != warmup and i != args.iterations: continue
+            gc.collect()
+            sample = {
+                'iteration': i,
+                'seconds': round(time.monotonic() - started, 1),
+                'rss_mib': round(rss_bytes() / 1048576, 1),
+                'threads': pymusic_threads(),
+                'traced_mib': round(tracemalloc.get_traced_memory()[0] / 1048576, 1),
+                'p95_ms': round(percentile(window, 0.95), 1),
+                'playlist': len(app.active_playlist),
+            }
+            window = []
+            samples.append(sample)
+            print(json.dumps(sample, ensure_ascii=False), flush=True)
+            if i == warmup: baseline = (sample, tracemalloc.take_snapshot())
+
+    final = samples[-1]
+    snapshot = tracemalloc.take_snapshot()
+    growth = {
+        'rss_mib': round(final['rss_mib'] - baseline[0]['rss_mib'], 1),
+        'threads': final['threads'] - baseline[0]['threads'],
+        'traced_mib': round(final['traced_mib'] - baseline[0]['traced_mib'], 1),
+    }
+    # Latencia: cada tipo de carga en la primera y la segunda mitad tras el calentamiento
+    middle = (warmup + args.iterations) // 2
+    latency = {}
+    for kind, values in latencies.items():
+        early = [ms for i, ms in values if warmup < i <= middle]
+        late = [ms for i, ms in values if i > middle]
+        latency[kind] = {'n': len(values), 'p95': round(percentile([ms for _, ms in values], 0.95), 1),
+                         'p50_early': round(percentile(early, 0.5), 1), 'p50_late': round(percentile(late, 0.5), 1),
+                         'comparable': min(len(early), len(late)) >= 5}
+    failures = []
+    if growth['rss_mib'] > args.max_rss_mib: failures.append(f"RSS creció {growth['rss_mib']} MiB (máx. {args.max_rss_mib})")
+    if growth['threads'] > args.max_threads: failures.append(f"{growth['threads']} hilos más (máx. {args.max_threads})")
+    if growth['traced_mib'] > args.max_traced_mib: failures.append(f"Memoria trazada creció {growth['traced_mib']} MiB (máx. {args.max_traced_mib})")
+    for kind, stats in latency.items():
+        # Con menos de 5 cargas por mitad, o menos de 50 ms de diferencia, se considera ruido
+        if not stats['comparable'] or stats['p50_late'] - stats['p50_early'] <= 50: continue
+        if stats['p50_late'] > stats['p50_early'] * args.max_latency_growth:
+            failures.append(f"Mediana de '{kind}' pasó de {stats['p50_early']} a {stats['p50_late']} ms (máx. x{args.max_latency_growth})")
+    if timeouts: failures.append(f"{timeouts} cargas sin completar en 10 s")
+    return {
+        'iterations': args.iterations,
+        'samples': samples,
+        'growth': growth,
+        'latency_ms': latency,
+        'top_growth': [str(s) for s in snapshot.compare_to(baseline[1], 'lineno')[:15]],
+        'failures': failures,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de resistencia de pymusic (memoria, hilos y latencia)")
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--sample-every', type=int, default=250)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--artists', type=int, default=20)
+    parser.add_argument('--albums', type=int, default=5)
+    parser.add_argument('--tracks', type=int, default=12)
+    parser.add_argument('--max-rss-mib', type=float, default=64, help="Crecimiento máximo de RSS tras el calentamiento")
+    parser.add_argument('--max-threads', type=int, default=4, help="Hilos de más permitidos tras el calentamiento")
+    parser.add_argument('--max-traced-mib', type=float, default=32, help="Crecimiento máximo de la memoria trazada")
+    parser.add_argument('--max-latency-growth', type=float, default=1.5, help="Factor máximo entre la mediana de carga final y la inicial")
+    parser.add_argument('--trace-frames', type=int, default=1, help="Marcos por asignación en tracemalloc (más = más lento)")
+    parser.add_argument('--report', help="Fichero JSON con el informe completo")
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as root:
+        albums, tracks, playlists = build_library(root, args.artists, args.albums, args.tracks)
+        DavHandler.root = root
+        server = DavServer(('127.0.0.1', 0), DavHandler)
+        threading.Thread(target=server.serve_forever, daemon=True, name="dav").start()
+        conf = os.path.join(root, 'pymusic.conf')
+        with open(conf, 'w', encoding='utf-8') as f:
+            f.write(f"[Servidor]\nWEBDAV_SERVER = http://127.0.0.1:{server.server_port}/musica/\n"
+                    "ROOT_PATH = /musica/\nPLAYLISTS_DIR = /musica/listas/\nBUFFER_PROFILE = auto\n")
+        tracemalloc.start(args.trace_frames)
+        try: report = asyncio.run(soak(args, conf, albums, tracks, playlists))
+        finally:
+            tracemalloc.stop()
+            server.shutdown()
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps({k: report[k] for k in ('growth', 'latency_ms', 'failures')}, ensure_ascii=False, indent=2))
+    return 1 if report['failures'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,24 +6,36 @@ import configparser
 import threading
 import time
 import shutil
+import hashlib
+import gzip
+import email.utils
+import socket
+import contextlib
+import unicodedata
+import re
+import bisect
+import argparse
+import json
+import concurrent.futures
+import multiprocessing
+import struct
+import tempfile
+import ctypes
+import ctypes.util
+import tracemalloc
 from datetime import datetime
 
 import requests
 
 # --- DEPENDENCIAS DE AUDIO (MPV) ---
-try:
-    import mpv
-    HAS_MPV = True
-except ImportError:
-    HAS_MPV = False
-    print("ERROR CRÍTICO: Instala python-mpv (pip install python-mpv).")
-    print("NOTA: Necesitas tener la librería libmpv instalada en tu sistema.")
-    sys.exit(1)
-except OSError:
-    print("ERROR CRÍTICO: No se encontró la librería compartida de MPV (libmpv).")
-    print("En Linux: sudo apt install libmpv1")
-    print("En Windows: Asegúrate de tener mpv-1.dll en el PATH o junto al script.")
-    sys.exit(1)
+# Solo la interfaz reproduce: check/dedup/index/sync funcionan sin libmpv (p. ej. en el NAS)
+mpv = None
+
+def load_mpv():
+    """Importa python-mpv la primera vez; ImportError/OSError si falta el módulo o libmpv."""
+    global mpv
+    if mpv is None: import mpv
+    return mpv
 
 try:
     from textual.app import App, ComposeResult
@@ -50,7 +62,9 @@ class ConfigManager:
             'PASS': '',
             'ROOT_PATH': '/musica/',
             'PLAYLISTS_DIR': '/musica/listas/',
-            'LOCAL_PATH': '' 
+            'LOCAL_PATH': '',
+            'BACKEND': 'webdav',
+            'MANIFEST': ''
         }
 
         if not os.path.exists(config_path):
@@ -85,27 +99,313 @@ class ConfigManager:
         self.queue_file = f"{self.user_playlists_path}en_cola.m3u"
         self.played_queue_file = f"{self.user_playlists_path}reproducida_en_cola.m3u"
 
-    def get(self, key): 
-        return self.config.get('Servidor', key, fallback="")
+    def get(self, key, section='Servidor'): 
+        return self.config.get(section, key, fallback="")
 
-# --- CLIENTE WEBDAV ---
-class WebDAVClient:
-    def __init__(self, config: ConfigManager):
-        raw_url = config.get('WEBDAV_SERVER')
+    def source_sections(self):
+        # Fuentes adicionales: secciones [Servidor:nombre] con su propio servidor, credenciales y ROOT_PATH
+        return [s for s in self.config.sections() if s.startswith('Servidor:')]
+
+AUDIO_EXTS = ('.mp3', '.ogg', '.flac', '.wav', '.m4a', '.opus')
+
+# --- MODELO DE PISTA ---
+class Track:
+    """Pista compacta para listas enormes.
+
+    El directorio y el álbum se internan con sys.intern, así las miles de pistas
+    de un mismo álbum comparten una sola copia de esas cadenas. La ruta completa
+    se reconstruye bajo demanda (directorio + nombre de fichero).
+    """
+    __slots__ = ('name', 'album', '_dir', '_base')
+
+    def __init__(self, path, name, album):
+        head, sep, base = path.rpartition('/')
+        self._dir = sys.intern(head + sep)
+        self._base = base
+        self.name = base if name == base else name
+        self.album = sys.intern(album)
+
+    @classmethod
+    def from_path(cls, path):
+        decoded = urllib.parse.unquote(path)
+        parts = decoded.rstrip('/').split('/')
+        return cls(path, parts[-1], parts[-2] if len(parts) > 1 else "-")
+
+    @property
+    def path(self):
+        return self._dir + self._base
+
+    def __repr__(self):
+        return f"Track({self.path!r})"
+
+# Bloques Unicode de marcas combinantes (tildes, diéresis...) que quedan tras NFKD
+_COMBINING_MARKS = re.compile('[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]')
+
+def fold_text(text):
+    """Minúsculas y sin acentos: 'Canción' y 'CANCION' se buscan igual."""
+    return _COMBINING_MARKS.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+def search_keys(tracks):
+    # Plegar un único texto con todas las pistas es varias veces más rápido que pista a pista
+    if not tracks: return []
+    return fold_text("\n".join(f"{t.album} {t.name}".replace("\n", " ") for t in tracks)).split("\n")
+
+
+class PlaylistSearch:
+    """Índice de búsqueda de active_playlist: claves plegadas unidas en bloques de texto.
+
+    Cada bloque guarda hasta BLOCK claves en una sola cadena ("clave\\n" por pista) con el
+    desplazamiento de cada fila, así que buscar es un str.find en C por bloque, y añadir
+    o quitar pistas solo reconstruye el bloque afectado. Los bloques que no contienen
+    todos los pares de letras de la búsqueda se saltan sin recorrerlos.
+    """
+    BLOCK = 1024
+
+    def __init__(self, keys=(), source=None):
+        self.source = source
+        self._blocks = []
+        self._starts = []
+        self.extend(keys)
+
+    def __len__(self):
+        return self._starts[-1] + len(self._blocks[-1][0]) if self._blocks else 0
+
+    @staticmethod
+    def _build(keys):
+        offsets = [0]
+        for key in keys: offsets.append(offsets[-1] + len(key) + 1)
+        text = "\n".join(keys) + "\n"
+        return [keys, text, offsets, set(zip(text, text[1:]))]
+
+    @staticmethod
+    def _pairs(query):
+        return set(zip(query, query[1:]))
+
+    def _reindex(self):
+        self._starts, total = [], 0
+        for block in self._blocks:
+            self._starts.append(total)
+            total += len(block[0])
+
+    def extend(self, keys):
+        keys = list(keys)
+        if not keys: return
+        if self._blocks and len(self._blocks[-1][0]) < self.BLOCK:
+            last = self._blocks.pop()[0]
+            keys = last + keys
+        for i in range(0, len(keys), self.BLOCK): self._blocks.append(self._build(keys[i:i + self.BLOCK]))
+        self._reindex()
+
+    def remove(self, row):
+        b = bisect.bisect_right(self._starts, row) - 1
+        keys = self._blocks[b][0]
+        del keys[row - self._starts[b]]
+        if keys: self._blocks[b] = self._build(keys)
+        else: del self._blocks[b]
+        self._reindex()
+
+    def _scan(self, query, lo, hi):
+        pairs = self._pairs(query)
+        b = max(bisect.bisect_right(self._starts, lo) - 1, 0)
+        while b < len(self._blocks) and self._starts[b] < hi:
+            keys, text, offsets, present = self._blocks[b]
+            base = self._starts[b]
+            if not pairs <= present:
+                b += 1
+                continue
+            pos = text.find(query, offsets[max(lo - base, 0)], offsets[min(hi - base, len(keys))])
+            if pos >= 0: return base + bisect.bisect_right(offsets, pos) - 1
+            b += 1
+        return None
+
+    def _rscan(self, query, lo, hi):
+        pairs = self._pairs(query)
+        b = bisect.bisect_right(self._starts, hi - 1) - 1
+        while b >= 0 and self._starts[b] + len(self._blocks[b][0]) > lo:
+            keys, text, offsets, present = self._blocks[b]
+            base = self._starts[b]
+            if not pairs <= present:
+                b -= 1
+                continue
+            pos = text.rfind(query, offsets[max(lo - base, 0)], offsets[min(hi - base, len(keys))])
+            if pos >= 0: return base + bisect.bisect_right(offsets, pos) - 1
+            b -= 1
+        return None
+
+    def find(self, query, start=0, reverse=False):
+        """Fila de la primera coincidencia desde start (incluida), o de la última antes de start
+        con reverse; se da la vuelta al llegar a un extremo. None si no hay ninguna."""
+        query, total = fold_text(query), len(self)
+        if not query or not total or "\n" in query: return None
+        start %= total
+        if reverse:
+            row = self._rscan(query, 0, start)
+            return row if row is not None else self._rscan(query, start, total)
+        row = self._scan(query, start, total)
+        return row if row is not None else self._scan(query, 0, start)
+
+    def count(self, query):
+        query, rows = fold_text(query), 0
+        if not query or "\n" in query: return 0
+        pairs = self._pairs(query)
+        for keys, text, offsets, present in self._blocks:
+            if not pairs <= present: continue
+            pos = text.find(query)
+            while pos >= 0:
+                row = bisect.bisect_right(offsets, pos) - 1
+                rows += 1
+                pos = text.find(query, offsets[row + 1])
+        return rows
+
+# --- CARGAS EN SEGUNDO PLANO ---
+class LoadCancelled(Exception):
+    pass
+
+
+class LoadToken:
+    """Identifica una carga dentro de su canal; cancelarla cierra sus peticiones HTTP en curso."""
+    __slots__ = ('channel', 'generation', '_event', '_callbacks', '_lock')
+
+    def __init__(self, channel, generation):
+        self.channel = channel
+        self.generation = generation
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set(): raise LoadCancelled()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try: callback()
+            except Exception: pass
+
+    @contextlib.contextmanager
+    def on_cancel(self, callback):
+        with self._lock:
+            registered = not self._event.is_set()
+            if registered: self._callbacks.append(callback)
+        if not registered: callback()
+        try: yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks: self._callbacks.remove(callback)
+
+
+_load_context = threading.local()
+
+def current_token():
+    return getattr(_load_context, 'token', None)
+
+def check_cancelled():
+    token = current_token()
+    if token is not None: token.check()
+
+
+class BackgroundLoader:
+    """Pool de hilos compartido y acotado para las cargas de la interfaz.
+
+    Cada submit() en un canal cancela la carga anterior de ese canal; canal None
+    significa una tarea independiente que nunca se sustituye.
+    """
+    def __init__(self, max_workers=4):
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="loader")
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._tokens = {}
+
+    def submit(self, channel, fn, *args):
+        with self._lock:
+            generation = self._generations.get(channel, 0) + 1
+            self._generations[channel] = generation
+            token = LoadToken(channel, generation)
+            previous = self._tokens.get(channel) if channel is not None else None
+            if channel is not None: self._tokens[channel] = token
+        if previous: previous.cancel()
+        self._pool.submit(self._run, token, fn, args)
+        return token
+
+    def cancel(self, channel):
+        with self._lock: token = self._tokens.pop(channel, None)
+        if token: token.cancel()
+
+    def _run(self, token, fn, args):
+        if token.cancelled: return
+        _load_context.token = token
+        try: fn(token, *args)
+        except LoadCancelled: pass
+        finally:
+            _load_context.token = None
+            with self._lock:
+                if self._tokens.get(token.channel) is token: del self._tokens[token.channel]
+
+    def shutdown(self):
+        with self._lock: tokens = list(self._tokens.values())
+        for token in tokens: token.cancel()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+# --- ALMACENAMIENTO ---
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend:
+    """Interfaz de almacenamiento detrás de WebDAVClient.
+
+    list_directory devuelve dicts {'name', 'path', 'is_dir'} ordenados (carpetas primero),
+    con 'etag' y 'size' opcionales.
+    read_file devuelve "" si el fichero no existe. Los fallos de red o disco lanzan StorageError.
+    """
+    def list_directory(self, path): raise NotImplementedError
+    def read_file(self, path): raise NotImplementedError
+    def save_file(self, path, content): raise NotImplementedError
+    def stream_url(self, path): raise NotImplementedError
+    def exists(self, path): raise NotImplementedError
+    def read_range(self, path, start, length): raise NotImplementedError
+
+    def read_file_etag(self, path, etag=None):
+        """Lectura condicional: (None, etag) si no ha cambiado, ("", None) si no existe."""
+        return self.read_file(path), None
+
+    def save_file_etag(self, path, content):
+        return self.save_file(path, content), None
+
+
+def sort_items(items):
+    return sorted(items, key=lambda x: (not x['is_dir'], x['name'].lower()))
+
+
+def http_date(text):
+    """Fecha HTTP (getlastmodified, Date) a epoch; None si falta o no se entiende."""
+    try: return email.utils.parsedate_to_datetime(text).timestamp()
+    except (TypeError, ValueError, IndexError): return None
+
+
+class WebDAVBackend(StorageBackend):
+    def __init__(self, config: ConfigManager, section='Servidor'):
+        raw_url = config.get('WEBDAV_SERVER', section)
         if not raw_url or "TU_IP_AQUI" in raw_url:
-            print("❌ ERROR: Configura la URL en 'pymusic.conf'")
+            print(f"❌ ERROR: Configura la URL de [{section}] en 'pymusic.conf'")
             sys.exit(1)
 
         self.base_url = raw_url.rstrip('/')
-        self.user = config.get('USER')
-        self.password = config.get('PASS')
+        self.user = config.get('USER', section)
+        self.password = config.get('PASS', section)
+        try: self.timeout = float(config.get('TIMEOUT', section) or 10)
+        except ValueError: self.timeout = 10.0
         self.auth = (self.user, self.password) if self.user else None
         self.session = requests.Session()
         self.session.auth = self.auth
-        self.history_file = config.history_file
-        self.favorites_file = config.favorites_file
-        self.fav_albums_file = config.fav_albums_file
-        
+
         parsed = urllib.parse.urlparse(self.base_url)
         self.server_root = f"{parsed.scheme}://{parsed.netloc}" 
 
@@ -116,7 +416,7 @@ class WebDAVClient:
         url = f"{self.server_root}{encoded_path}"
         return url
 
-    def get_stream_url(self, path):
+    def stream_url(self, path):
         url = self.get_full_url(path)
         if self.user and self.password:
             try:
@@ -127,14 +427,92 @@ class WebDAVClient:
             except: return url
         return url
 
+    def _request(self, method, url, **kwargs):
+        # Dentro de una carga cancelable el cuerpo se lee en streaming y cancelar cierra la conexión
+        token = current_token()
+        if token is None: return self.session.request(method, url, **kwargs)
+        token.check()
+        r = self.session.request(method, url, stream=True, **kwargs)
+        chunks = []
+        with token.on_cancel(lambda: self._abort(r)):
+            try:
+                for chunk in r.iter_content(64 * 1024):
+                    token.check()
+                    chunks.append(chunk)
+            except LoadCancelled: raise
+            except Exception:
+                token.check()
+                raise
+            finally: r.close()
+        r._content = b"".join(chunks)
+        return r
+
+    @staticmethod
+    def _abort(r):
+        # shutdown() despierta a un recv() bloqueado en otro hilo; el lector cierra la respuesta
+        try: r.raw.shutdown()
+        except Exception:
+            try: r.raw.connection.sock.shutdown(socket.SHUT_RDWR)
+            except Exception: pass
+
+    def read_range(self, path, start, length):
+        headers = {'Range': f"bytes={start}-{start + length - 1}"}
+        try:
+            r = self.session.get(self.get_full_url(path), headers=headers, stream=True, timeout=self.timeout)
+            try:
+                if r.status_code not in (200, 206): raise StorageError(f"GET {r.status_code}")
+                # Un servidor sin soporte de Range responde 200: se descarta lo anterior a start
+                skip = start if r.status_code == 200 else 0
+                data = bytearray()
+                for chunk in r.iter_content(64 * 1024):
+                    data += chunk
+                    if len(data) >= skip + length: break
+                return bytes(data[skip:skip + length])
+            finally: r.close()
+        except requests.RequestException as e:
+            raise StorageError(str(e))
+
+    def download(self, path, dest, if_range=None, throttle=None):
+        """Descarga path en dest. Si dest ya tiene datos y if_range es el ETag con el que se
+        empezaron, continúa desde el final; el servidor responde 200 si la versión cambió.
+        Devuelve los bytes recibidos."""
+        start = os.path.getsize(dest) if if_range and os.path.exists(dest) else 0
+        headers = {'Range': f"bytes={start}-", 'If-Range': if_range} if start else {}
+        received = 0
+        try:
+            r = self.session.get(self.get_full_url(path), headers=headers, stream=True, timeout=self.timeout)
+            try:
+                if r.status_code == 416: return 0
+                if r.status_code not in (200, 206): raise StorageError(f"GET {r.status_code}")
+                with open(dest, 'ab' if r.status_code == 206 else 'wb') as f:
+                    for chunk in r.iter_content(256 * 1024):
+                        check_cancelled()
+                        if throttle: throttle(len(chunk))
+                        f.write(chunk)
+                        received += len(chunk)
+            finally: r.close()
+        except (requests.RequestException, OSError) as e:
+            raise StorageError(str(e))
+        return received
+
+    def exists(self, path):
+        try:
+            r = self._request('HEAD', self.get_full_url(path), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(str(e))
+        if r.status_code in (404, 410): return False
+        if r.status_code < 400: return True
+        raise StorageError(f"HEAD {r.status_code}")
+
     def list_directory(self, path):
         url = self.get_full_url(path)
         headers = {'Depth': '1'}
         try:
-            r = self.session.request('PROPFIND', url, headers=headers, timeout=10)
-            if r.status_code == 207: return self._parse_xml(r.content, path)
-            return []
-        except: return []
+            r = self._request('PROPFIND', url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(str(e))
+        if r.status_code != 207: raise StorageError(f"PROPFIND {r.status_code}")
+        return self._parse_xml(r.content, path)
 
     def _parse_xml(self, content, current_path):
         items = []
@@ -155,6 +533,7 @@ class WebDAVClient:
                 if clean_href == decoded_curr or clean_href == decoded_curr + "/": continue
 
                 is_dir = False
+                etag = size = modified = None
                 propstat = response.find('.//d:propstat', ns) if ns_url else response.find('.//propstat')
                 if propstat:
                     prop = propstat.find('.//d:prop', ns) if ns_url else propstat.find('.//prop')
@@ -163,97 +542,880 @@ class WebDAVClient:
                         if rtype is not None:
                             coll = rtype.find('.//d:collection', ns) if ns_url else rtype.find('.//collection')
                             if coll is not None: is_dir = True
-                items.append({'name': name, 'path': raw_href, 'is_dir': is_dir})
+                        etag_tag = prop.find('.//d:getetag', ns) if ns_url else prop.find('.//getetag')
+                        if etag_tag is not None: etag = etag_tag.text
+                        size_tag = prop.find('.//d:getcontentlength', ns) if ns_url else prop.find('.//getcontentlength')
+                        if size_tag is not None and (size_tag.text or '').isdigit(): size = int(size_tag.text)
+                        mod_tag = prop.find('.//d:getlastmodified', ns) if ns_url else prop.find('.//getlastmodified')
+                        if mod_tag is not None: modified = mod_tag.text
+                items.append({'name': name, 'path': raw_href, 'is_dir': is_dir, 'etag': etag, 'size': size, 'modified': modified})
         except: pass
-        return sorted(items, key=lambda x: (not x['is_dir'], x['name'].lower()))
+        return sort_items(items)
 
     def read_file(self, path):
-        url = self.get_full_url(path)
         try:
-            r = self.session.get(url)
-            return r.text if r.status_code == 200 else ""
-        except: return ""
+            r = self._request('GET', self.get_full_url(path), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(str(e))
+        return r.text if r.status_code == 200 else ""
+
+    def read_file_etag(self, path, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            r = self._request('GET', self.get_full_url(path), headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(str(e))
+        if r.status_code == 304: return None, etag
+        if r.status_code == 200: return r.text, r.headers.get('ETag')
+        if r.status_code == 404: return "", None
+        raise StorageError(f"GET {r.status_code}")
+
+    def read_bytes_etag(self, path, etag=None):
+        """Como read_file_etag, sin decodificar: (None, etag) si no ha cambiado, (b"", None) si no existe."""
+        headers = {'If-None-Match': etag} if etag else {}
+        try:
+            r = self._request('GET', self.get_full_url(path), headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(str(e))
+        if r.status_code == 304: return None, etag
+        if r.status_code == 200: return r.content, r.headers.get('ETag')
+        if r.status_code == 404: return b"", None
+        raise StorageError(f"GET {r.status_code}")
+
+    def server_time(self, path):
+        """Hora del servidor (epoch) según la cabecera Date de un HEAD; la local si no la envía."""
+        try:
+            r = self._request('HEAD', self.get_full_url(path), timeout=self.timeout)
+        except requests.RequestException as e:
+            raise StorageError(str(e))
+        server = http_date(r.headers.get('Date'))
+        return time.time() if server is None else server
 
     def save_file(self, path, content):
-        url = self.get_full_url(path)
+        return self.save_file_etag(path, content)[0]
+
+    def save_file_etag(self, path, content):
         try:
-            r = self.session.put(url, data=content.encode('utf-8'), headers={'Content-Type': 'audio/x-mpegurl; charset=utf-8'})
+            r = self.session.put(self.get_full_url(path), data=content.encode('utf-8'), headers={'Content-Type': 'audio/x-mpegurl; charset=utf-8'}, timeout=self.timeout)
+            return r.status_code in [200, 201, 204], r.headers.get('ETag')
+        except requests.RequestException: return False, None
+
+    def save_bytes(self, path, data, content_type='application/octet-stream'):
+        try:
+            r = self.session.put(self.get_full_url(path), data=data, headers={'Content-Type': content_type}, timeout=self.timeout)
             return r.status_code in [200, 201, 204]
-        except: return False
+        except requests.RequestException: return False
+
+class _Inotify:
+    """Vigilancia de directorios con inotify (Linux) vía ctypes, sin dependencias extra."""
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO = 0x002, 0x004, 0x008, 0x040, 0x080
+    IN_CREATE, IN_DELETE, IN_DELETE_SELF, IN_MOVE_SELF = 0x100, 0x200, 0x400, 0x800
+    IN_Q_OVERFLOW, IN_IGNORED = 0x4000, 0x8000
+    # IN_MODIFY/IN_CLOSE_WRITE: reescribir un fichero no cambia el mtime del directorio
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    def __init__(self, on_change):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.on_change = on_change
+        self._wds = {}
+        self._dirs = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._loop, daemon=True, name="inotify").start()
+
+    def watch(self, directory):
+        with self._lock:
+            if directory in self._dirs: return True
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0: return False
+        with self._lock:
+            self._wds[wd] = directory
+            self._dirs[directory] = wd
+        return True
+
+    def is_watched(self, directory):
+        with self._lock: return directory in self._dirs
+
+    def _loop(self):
+        while True:
+            try: data = os.read(self.fd, 64 * 1024)
+            except OSError: return
+            offset = 0
+            while offset + 16 <= len(data):
+                wd, mask, _cookie, length = struct.unpack_from('iIII', data, offset)
+                offset += 16 + length
+                if mask & self.IN_Q_OVERFLOW:
+                    self.on_change(None)
+                    continue
+                with self._lock:
+                    directory = self._wds.get(wd)
+                    if mask & self.IN_IGNORED and directory:
+                        del self._wds[wd]
+                        self._dirs.pop(directory, None)
+                if directory: self.on_change(directory)
+
+
+class LocalBackend(StorageBackend):
+    """Biblioteca en disco local: ROOT_PATH del servidor se corresponde con LOCAL_PATH.
+
+    Los listados se cachean y se invalidan con inotify; si no está disponible
+    (o se agotan los watches) se revalidan comparando el mtime del directorio
+    y se vuelve a hacer stat de los ficheros, que pueden cambiar sin tocarlo.
+    """
+    def __init__(self, config: ConfigManager):
+        if not config.local_path:
+            print("❌ ERROR: BACKEND = local necesita LOCAL_PATH en 'pymusic.conf'")
+            sys.exit(1)
+        self.root_path = urllib.parse.unquote(config.get('ROOT_PATH')).rstrip('/')
+        self.local_path = config.local_path
+        self._cache = {}
+        self._version = 0
+        self._lock = threading.Lock()
+        try: self._inotify = _Inotify(self._invalidate)
+        except (OSError, AttributeError, TypeError): self._inotify = None
+
+    def to_local(self, path):
+        decoded = urllib.parse.unquote(path)
+        if "://" in decoded: decoded = "/" + decoded.split("://", 1)[1].split("/", 1)[1]
+        if decoded != self.root_path and not decoded.startswith(self.root_path + '/'):
+            raise StorageError(f"Fuera de ROOT_PATH: {decoded}")
+        rel = decoded[len(self.root_path):].lstrip('/')
+        return os.path.join(self.local_path, rel).rstrip('/') or '/'
+
+    def _invalidate(self, directory):
+        with self._lock:
+            self._version += 1
+            if directory is None: self._cache.clear()
+            else: self._cache.pop(directory, None)
+
+    def list_directory(self, path):
+        check_cancelled()
+        local = self.to_local(path)
+        with self._lock: cached = self._cache.get(local)
+        # Con inotify activo la caché es válida hasta que llegue un evento
+        if cached and self._inotify and self._inotify.is_watched(local): return cached[1]
+        try: mtime = os.stat(local).st_mtime_ns
+        except OSError as e: raise StorageError(str(e))
+        if cached and cached[0] == mtime: return self._restat(local, cached[1])
+        # Vigilar antes de leer: un cambio durante el scandir no deja la caché obsoleta
+        if self._inotify: self._inotify.watch(local)
+        with self._lock: version = self._version
+
+        virtual = urllib.parse.quote(urllib.parse.unquote(path).rstrip('/'), safe='/')
+        items = []
+        try:
+            with os.scandir(local) as it:
+                for entry in it:
+                    if entry.name.startswith('.'): continue
+                    is_dir = entry.is_dir()
+                    href = f"{virtual}/{urllib.parse.quote(entry.name)}" + ('/' if is_dir else '')
+                    item = {'name': entry.name, 'path': href, 'is_dir': is_dir}
+                    if not is_dir:
+                        try: st = entry.stat()
+                        except FileNotFoundError: continue
+                        item.update(size=st.st_size, etag=f'"{st.st_mtime_ns:x}-{st.st_size:x}"')
+                    items.append(item)
+        except OSError as e: raise StorageError(str(e))
+        items = sort_items(items)
+        with self._lock:
+            if self._version == version: self._cache[local] = (mtime, items)
+        return items
+
+    @staticmethod
+    def _restat(local, items):
+        fresh = []
+        for item in items:
+            if not item['is_dir']:
+                try: st = os.stat(os.path.join(local, item['name']))
+                except FileNotFoundError: continue
+                except OSError as e: raise StorageError(str(e))
+                item = dict(item, size=st.st_size, etag=f'"{st.st_mtime_ns:x}-{st.st_size:x}"')
+            fresh.append(item)
+        return fresh
+
+    def read_file(self, path):
+        try:
+            with open(self.to_local(path), encoding='utf-8', errors='replace') as f: return f.read()
+        except FileNotFoundError: return ""
+        except OSError as e: raise StorageError(str(e))
+
+    @staticmethod
+    def _etag(local):
+        st = os.stat(local)
+        return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+    def read_range(self, path, start, length):
+        try:
+            with open(self.to_local(path), 'rb') as f:
+                f.seek(start)
+                return f.read(length)
+        except OSError as e: raise StorageError(str(e))
+
+    def read_file_etag(self, path, etag=None):
+        local = self.to_local(path)
+        try:
+            if etag and self._etag(local) == etag: return None, etag
+            with open(local, encoding='utf-8', errors='replace') as f: text = f.read()
+            return text, self._etag(local)
+        except FileNotFoundError: return "", None
+        except OSError as e: raise StorageError(str(e))
+
+    def save_file_etag(self, path, content):
+        if not self.save_file(path, content): return False, None
+        try: return True, self._etag(self.to_local(path))
+        except OSError: return True, None
+
+    def save_file(self, path, content):
+        # Escritura atómica: fichero temporal en el mismo directorio + os.replace
+        try:
+            local = self.to_local(path)
+            directory = os.path.dirname(local)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.pymusic-')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f: f.write(content)
+                # mkstemp crea con 0600: se conservan los permisos del fichero original
+                try: os.chmod(tmp, os.stat(local).st_mode & 0o777)
+                except FileNotFoundError: os.chmod(tmp, 0o644)
+                os.replace(tmp, local)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+            self._invalidate(directory)
+            return True
+        except (OSError, StorageError): return False
+
+    def stream_url(self, path):
+        return self.to_local(path)
+
+    def exists(self, path):
+        try: return os.path.exists(self.to_local(path))
+        except StorageError: return False
+
+class _Source:
+    __slots__ = ('name', 'backend', 'root', 'timeout', 'latency')
+
+    def __init__(self, name, backend, root, timeout):
+        self.name = name
+        self.backend = backend
+        self.root = urllib.parse.unquote(root or '/').rstrip('/')
+        self.timeout = timeout
+        self.latency = None
+
+
+class FederatedBackend(StorageBackend):
+    """Varias fuentes WebDAV unidas en un único árbol virtual bajo el ROOT_PATH principal.
+
+    Listados, lecturas y comprobaciones se lanzan a todas las fuentes en paralelo;
+    la que supera su timeout se ignora. Las escrituras van a la fuente principal
+    (la primera) y cada pista se reproduce desde la réplica con menor latencia medida.
+    """
+    def __init__(self, sources):
+        self.sources = sources
+        self.primary = sources[0]
+        self.root = self.primary.root
+        self._replicas = {}
+        self._lock = threading.Lock()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=4 * len(sources), thread_name_prefix="federation")
+
+    def _rel(self, path):
+        decoded = urllib.parse.unquote(path)
+        if "://" in decoded: decoded = "/" + decoded.split("://", 1)[1].split("/", 1)[1]
+        if decoded != self.root and not decoded.startswith(self.root + '/'):
+            raise StorageError(f"Fuera de ROOT_PATH: {decoded}")
+        return decoded[len(self.root):]
+
+    def _to_source(self, source, path):
+        return urllib.parse.quote(source.root + self._rel(path), safe='/')
+
+    def _to_virtual(self, source, href):
+        decoded = urllib.parse.unquote(href)
+        if "://" in decoded: decoded = "/" + decoded.split("://", 1)[1].split("/", 1)[1]
+        rel = decoded[len(source.root):] if decoded.startswith(source.root) else decoded
+        return urllib.parse.quote(self.root + rel, safe='/')
+
+    def _call(self, token, source, method, *args):
+        # El token de la carga viaja al hilo del pool para que cancelar siga cortando la petición
+        _load_context.token = token
+        started = time.monotonic()
+        try:
+            result = getattr(source.backend, method)(*args)
+        except StorageError:
+            source.latency = float('inf')
+            raise
+        finally: _load_context.token = None
+        elapsed = time.monotonic() - started
+        source.latency = elapsed if source.latency in (None, float('inf')) else 0.7 * source.latency + 0.3 * elapsed
+        return result
+
+    def _fan_out(self, method, path, sources=None):
+        """Devuelve [(fuente, resultado)] de las fuentes que responden a tiempo, en orden de configuración."""
+        sources = sources or self.sources
+        token = current_token()
+        futures = []
+        for source in sources:
+            try: futures.append((source, self._pool.submit(self._call, token, source, method, self._to_source(source, path))))
+            except StorageError: pass
+        deadline = time.monotonic() + max(s.timeout for s in sources)
+        results, failures = [], []
+        for source, future in futures:
+            remaining = min(source.timeout, max(0.0, deadline - time.monotonic()))
+            try: results.append((source, future.result(timeout=remaining)))
+            except concurrent.futures.TimeoutError:
+                source.latency = float('inf')
+                failures.append(f"{source.name}: timeout")
+            except StorageError as e: failures.append(f"{source.name}: {e}")
+        check_cancelled()
+        if not results: raise StorageError("; ".join(failures) or "sin fuentes")
+        return results
+
+    def list_directory(self, path):
+        merged = {}
+        for source, items in self._fan_out('list_directory', path):
+            for item in items:
+                virtual = dict(item, path=self._to_virtual(source, item['path']))
+                merged.setdefault(item['name'], virtual)
+                if not item['is_dir']:
+                    with self._lock: self._replicas.setdefault(WebDAVClient._key(virtual['path']), set()).add(source.name)
+        return sort_items(merged.values())
+
+    def read_file(self, path):
+        results = self._fan_out('read_file', path)
+        return next((text for _source, text in results if text), "")
+
+    def exists(self, path):
+        return any(found for _source, found in self._fan_out('exists', path))
+
+    def read_range(self, path, start, length):
+        source = self.fastest_source(path)
+        return source.backend.read_range(self._to_source(source, path), start, length)
+
+    # Las listas se escriben y revalidan solo en la fuente principal
+    def read_file_etag(self, path, etag=None):
+        return self.primary.backend.read_file_etag(self._to_source(self.primary, path), etag)
+
+    def save_file(self, path, content):
+        return self.primary.backend.save_file(self._to_source(self.primary, path), content)
+
+    def save_file_etag(self, path, content):
+        return self.primary.backend.save_file_etag(self._to_source(self.primary, path), content)
+
+    def fastest_source(self, path):
+        with self._lock: names = self._replicas.get(WebDAVClient._key(path))
+        candidates = [s for s in self.sources if not names or s.name in names]
+        # Sin medidas todavía se mantiene el orden de configuración
+        return min(candidates, key=lambda s: s.latency if s.latency is not None else 0.0)
+
+    def stream_url(self, path):
+        source = self.fastest_source(path)
+        return source.backend.stream_url(self._to_source(source, path))
+
+    def latency_summary(self):
+        def fmt(s):
+            if s.latency is None: return f"{s.name}: ?"
+            return f"{s.name}: caída" if s.latency == float('inf') else f"{s.name}: {s.latency * 1000:.0f}ms"
+        return " | ".join(fmt(s) for s in self.sources)
+
+class ManifestBackend(StorageBackend):
+    """Listados servidos desde un manifiesto comprimido de toda la biblioteca (comando 'index').
+
+    El manifiesto se revalida con If-None-Match cada MANIFEST_TTL segundos (un 304 si no ha
+    cambiado) y entre revalidaciones se confía en él sin más peticiones. En cada revalidación
+    la raíz se lista en vivo. Tras cualquier listado en vivo, las subcarpetas cuya fecha no
+    coincide con la guardada en el manifiesto pasan a listarse en vivo, igual que las
+    carpetas que no aparecen en él.
+    """
+    def __init__(self, live, manifest_path, ttl=300):
+        self.live = live
+        self.manifest_path = manifest_path
+        self.ttl = ttl
+        self._dirs = {}
+        self._root = None
+        self._root_items = None
+        self._generated = 0
+        self._etag = None
+        self._checked = None
+        self._stale = set()
+        self._lock = threading.Lock()
+        self.manifest_hits = 0
+        self.live_lists = 0
+
+    def __getattr__(self, name):
+        # session, timeout, download... del backend real
+        return getattr(self.live, name)
+
+    @staticmethod
+    def _key(path):
+        return urllib.parse.unquote(path).rstrip('/') + '/'
+
+    def _refresh(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked is not None and now - self._checked < self.ttl: return
+            self._checked = now
+            try: data, etag = self.live.read_bytes_etag(self.manifest_path, self._etag)
+            except StorageError: data = None
+            if data is not None:
+                try: manifest = json.loads(gzip.decompress(data)) if data else {}
+                except (OSError, ValueError): manifest = None
+                if manifest is not None:
+                    if manifest.get('version') != MANIFEST_VERSION: manifest = {}
+                    self._dirs, self._generated = manifest.get('dirs', {}), manifest.get('generated', 0)
+                    self._root = self._key(manifest['root']) if manifest.get('root') else None
+                    self._etag, self._stale = etag, set()
+            # Una petición por TTL para ver carpetas nuevas o modificadas en el primer nivel
+            self._root_items = None
+            if self._root is None: return
+            try: items = self.live.list_directory(urllib.parse.quote(self._root, safe='/'))
+            except StorageError: return
+            self.live_lists += 1
+            self._compare(self._root, items)
+            self._root_items = items
+
+    def _compare(self, key, items):
+        """Marca como obsoletas las subcarpetas de key que han cambiado desde el manifiesto."""
+        recorded = {entry[0]: entry[4] for entry in self._dirs.get(key, ()) if entry[1]}
+        for item in items:
+            if not item['is_dir']: continue
+            modified = http_date(item.get('modified'))
+            if modified is None: continue
+            before = recorded.get(item['name'])
+            # Sin fecha guardada se compara con la generación (reloj del servidor, resolución de segundos)
+            changed = int(modified) != before if before is not None else modified >= self._generated
+            if changed: self._stale.add(key + item['name'] + '/')
+
+    def list_directory(self, path):
+        check_cancelled()
+        self._refresh()
+        key = self._key(path)
+        with self._lock:
+            if key == self._root and self._root_items is not None: return list(self._root_items)
+            entries = None if key in self._stale else self._dirs.get(key)
+        if entries is not None:
+            self.manifest_hits += 1
+            base = urllib.parse.quote(key, safe='/')
+            return [{'name': name, 'path': base + urllib.parse.quote(name) + ('/' if is_dir else ''),
+                     'is_dir': bool(is_dir), 'size': size, 'etag': etag} for name, is_dir, size, etag, _modified in entries]
+        self.live_lists += 1
+        items = self.live.list_directory(path)
+        with self._lock: self._compare(key, items)
+        return items
+
+    def summary(self):
+        return f"Manifiesto: {len(self._dirs)} carpetas | Desde manifiesto: {self.manifest_hits} | En vivo: {self.live_lists}"
+
+    def read_file(self, path): return self.live.read_file(path)
+    def save_file(self, path, content): return self.live.save_file(path, content)
+    def stream_url(self, path): return self.live.stream_url(path)
+    def exists(self, path): return self.live.exists(path)
+    def read_range(self, path, start, length): return self.live.read_range(path, start, length)
+    def read_file_etag(self, path, etag=None): return self.live.read_file_etag(path, etag)
+    def save_file_etag(self, path, content): return self.live.save_file_etag(path, content)
+
+# --- LISTAS EN MEMORIA ---
+def clean_track_path(path):
+    """Ruta tal y como se guarda en las listas: decodificada, sin esquema ni host y con '/' inicial."""
+    clean = urllib.parse.unquote(path).strip()
+    if "://" in clean:
+        clean = "/" + clean.split("://", 1)[1].split("/", 1)[1]
+    elif not clean.startswith("/"):
+        clean = "/" + clean
+    return clean
+
+
+class M3UFile:
+    __slots__ = ('lines', 'members', 'etag')
+
+    def __init__(self, lines, members, etag):
+        self.lines = lines
+        self.members = members
+        self.etag = etag
+
+    @property
+    def entries(self):
+        return [l for l in self.lines if not l.startswith('#')]
+
+
+class PlaylistStore:
+    """Caché de .m3u y albums.txt ya parseados, con pertenencia O(1) por conjunto.
+
+    Cada fichero se revalida con If-None-Match (un 304 no descarga nada) y solo
+    se vuelve a escribir si su contenido cambia. contains() nunca usa la red.
+    """
+    def __init__(self, client, root_path='/'):
+        self.client = client
+        self.root_prefix = urllib.parse.unquote(root_path).rstrip('/') + '/'
+        self._files = {}
+        self._lock = threading.Lock()
+        # Callbacks (ruta, M3UFile) cada vez que cambia el contenido conocido de un fichero
+        self.listeners = []
+
+    def _notify(self, path, parsed):
+        for listener in self.listeners:
+            try: listener(path, parsed)
+            except Exception: pass
+
+    def member_key(self, entry):
+        # Las entradas relativas de las listas cuelgan de ROOT_PATH
+        clean = urllib.parse.unquote(entry).strip()
+        if "://" in clean: clean = "/" + clean.split("://", 1)[1].split("/", 1)[1]
+        elif not clean.startswith("/"): clean = self.root_prefix + clean
+        return clean.rstrip('/')
+
+    def _parse(self, lines, etag):
+        members = {self.member_key(l) for l in lines if not l.startswith('#')}
+        return M3UFile(lines, members, etag)
+
+    def _load(self, path):
+        key = self.client._key(path)
+        with self._lock: cached = self._files.get(key)
+        text, etag = self.client.backend.read_file_etag(path, cached.etag if cached else None)
+        if text is None and cached: return cached
+        parsed = self._parse([l.strip() for l in (text or "").split('\n') if l.strip()], etag)
+        with self._lock: self._files[key] = parsed
+        self._notify(path, parsed)
+        return parsed
+
+    def get(self, path):
+        try: return self._load(path)
+        except StorageError:
+            with self._lock: return self._files.get(self.client._key(path))
+
+    def cached(self, path):
+        with self._lock: return self._files.get(self.client._key(path))
+
+    def contains(self, path, entry):
+        parsed = self.cached(path)
+        return parsed is not None and self.member_key(entry) in parsed.members
+
+    def mutate(self, path, fn):
+        """Aplica fn(líneas, miembros) -> nuevas líneas (None = sin cambios) bajo el lock del fichero."""
+        with self.client._file_lock(path):
+            try: current = self._load(path)
+            except StorageError: return False
+            new_lines = fn(list(current.lines), current.members)
+            if new_lines is None or new_lines == current.lines: return True
+            ok, etag = self.client._write(path, "\n".join(new_lines))
+            if ok:
+                parsed = self._parse(new_lines, etag)
+                with self._lock: self._files[self.client._key(path)] = parsed
+                self._notify(path, parsed)
+            return ok
+
+class PlaylistIndex:
+    """Índice inverso: pista normalizada -> listas .m3u que la contienen.
+
+    refresh() solo vuelve a leer las listas cuyo ETag (PROPFIND) ha cambiado, y
+    las escrituras hechas a través de PlaylistStore se aplican al momento.
+    """
+    def __init__(self, client, dirs):
+        self.client = client
+        self.dirs = list(dict.fromkeys(dirs))
+        self.ready = False
+        self._by_track = {}
+        self._by_playlist = {}
+        self._lock = threading.Lock()
+        client.store.listeners.append(self._on_store_update)
+
+    def _set_members(self, key, path, etag, members):
+        with self._lock:
+            old = self._by_playlist.get(key)
+            old_members = old[2] if old else set()
+            for m in old_members - members:
+                owners = self._by_track.get(m)
+                if owners:
+                    owners.discard(key)
+                    if not owners: del self._by_track[m]
+            for m in members - old_members:
+                self._by_track.setdefault(m, set()).add(key)
+            self._by_playlist[key] = (path, etag, members)
+
+    def _drop(self, key):
+        self._set_members(key, None, None, set())
+        with self._lock: self._by_playlist.pop(key, None)
+
+    def _on_store_update(self, path, parsed):
+        if not urllib.parse.unquote(path).lower().endswith('.m3u'): return
+        self._set_members(self.client._key(path), path, None, set(parsed.members))
+
+    def refresh(self):
+        for directory in self.dirs:
+            try: items = self.client.backend.list_directory(directory)
+            except StorageError: continue
+            seen = set()
+            for item in items:
+                if item['is_dir'] or not item['name'].lower().endswith('.m3u'): continue
+                key = self.client._key(item['path'])
+                seen.add(key)
+                etag = item.get('etag')
+                with self._lock: old = self._by_playlist.get(key)
+                if old and etag and old[1] == etag: continue
+                parsed = self.client.store.get(item['path'])
+                if parsed is not None: self._set_members(key, item['path'], etag, set(parsed.members))
+            dir_key = self.client._key(directory)
+            with self._lock:
+                gone = [k for k in self._by_playlist if k.rsplit('/', 1)[0] == dir_key and k not in seen]
+            for key in gone: self._drop(key)
+        self.ready = True
+
+    def playlists_for(self, track_path):
+        key = self.client.store.member_key(track_path)
+        with self._lock:
+            return sorted((self._by_playlist[k][0] for k in self._by_track.get(key, ())), key=lambda p: urllib.parse.unquote(p).lower())
+
+    def remove_everywhere(self, track_path):
+        key = self.client.store.member_key(track_path)
+        member_key = self.client.store.member_key
+        def drop(lines, members):
+            if key not in members: return None
+            return [l for l in lines if l.startswith('#') or member_key(l) != key]
+        return sum(1 for path in self.playlists_for(track_path) if self.client.store.mutate(path, drop))
+
+# --- CLIENTE WEBDAV ---
+class WebDAVClient:
+    def __init__(self, config: ConfigManager):
+        backend = (config.get('BACKEND') or 'webdav').lower()
+        if backend == 'local': self.backend = LocalBackend(config)
+        elif config.source_sections(): self.backend = self._federate(config)
+        else: self.backend = WebDAVBackend(config)
+        if config.get('MANIFEST') and isinstance(self.backend, WebDAVBackend):
+            try: ttl = float(config.get('MANIFEST_TTL') or 300)
+            except ValueError: ttl = 300.0
+            self.backend = ManifestBackend(self.backend, config.get('MANIFEST'), ttl)
+        self.history_file = config.history_file
+        self.favorites_file = config.favorites_file
+        self.fav_albums_file = config.fav_albums_file
+        self.store = PlaylistStore(self, config.get('ROOT_PATH') or '/')
+
+        # Single-flight: peticiones GET/PROPFIND idénticas y simultáneas comparten resultado
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.coalesce_hits = 0
+        self.coalesce_misses = 0
+        # Lectura-modificación-escritura serializada por fichero (cola, historial, favoritos)
+        self._file_locks = {}
+
+    @staticmethod
+    def _federate(config):
+        sources = []
+        for section in ['Servidor'] + config.source_sections():
+            backend = WebDAVBackend(config, section)
+            name = section.split(':', 1)[1] if ':' in section else 'principal'
+            sources.append(_Source(name, backend, config.get('ROOT_PATH', section) or '/', backend.timeout))
+        return FederatedBackend(sources)
+
+    @staticmethod
+    def _key(path):
+        decoded = urllib.parse.unquote(path)
+        return '/' + decoded.strip('/')
+
+    def _single_flight(self, key, fn):
+        while True:
+            with self._inflight_lock:
+                call = self._inflight.get(key)
+                leader = call is None
+                if leader:
+                    call = self._inflight[key] = {'event': threading.Event(), 'result': None, 'error': None}
+                    self.coalesce_misses += 1
+                else:
+                    self.coalesce_hits += 1
+            if leader: break
+            call['event'].wait()
+            # Si se canceló la carga que lideraba la petición, quien esperaba la repite
+            if isinstance(call['error'], LoadCancelled): continue
+            if call['error'] is not None: raise call['error']
+            return call['result']
+        try:
+            call['result'] = fn()
+        except BaseException as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._inflight_lock:
+                if self._inflight.get(key) is call: del self._inflight[key]
+            call['event'].set()
+        return call['result']
+
+    def _forget_inflight(self, path):
+        # Tras una escritura, las lecturas nuevas no deben unirse a un GET/PROPFIND anterior
+        key = self._key(path)
+        parent = key.rsplit('/', 1)[0] or '/'
+        with self._inflight_lock:
+            self._inflight.pop(('GET', key), None)
+            self._inflight.pop(('PROPFIND', parent), None)
+
+    def _file_lock(self, path):
+        with self._inflight_lock:
+            return self._file_locks.setdefault(self._key(path), threading.Lock())
+
+    def coalesce_stats(self):
+        total = self.coalesce_hits + self.coalesce_misses
+        text = f"Peticiones: {total} | Ahorradas: {self.coalesce_hits} | Reales: {self.coalesce_misses}"
+        if isinstance(self.backend, ManifestBackend): text += f" | {self.backend.summary()}"
+        return text
+
+    def get_stream_url(self, path):
+        return self.backend.stream_url(path)
+
+    def list_directory(self, path):
+        return list(self._single_flight(('PROPFIND', self._key(path)), lambda: self._list(path)))
+
+    def _list(self, path):
+        try: return self.backend.list_directory(path)
+        except StorageError: return []
+
+    def read_file(self, path):
+        return self._single_flight(('GET', self._key(path)), lambda: self._read(path))
+
+    def _read(self, path):
+        try: return self.backend.read_file(path)
+        except StorageError: return ""
+
+    def save_file(self, path, content):
+        return self._write(path, content)[0]
+
+    def _write(self, path, content):
+        self._forget_inflight(path)
+        try:
+            return self.backend.save_file_etag(path, content)
+        finally:
+            # Un GET iniciado durante la escritura no debe servir a lecturas posteriores
+            self._forget_inflight(path)
 
     def clear_file(self, path):
-        return self.save_file(path, "#EXTM3U\n")
+        return self.store.mutate(path, lambda lines, members: ["#EXTM3U"])
 
     def append_to_m3u(self, m3u_path, track_path):
-        try:
-            content = self.read_file(m3u_path)
-            track_clean = urllib.parse.unquote(track_path)
-            if "://" in track_clean:
-                track_clean = "/" + track_clean.split("://", 1)[1].split("/", 1)[1]
-            elif not track_clean.startswith("/"):
-                track_clean = "/" + track_clean
-            
-            new_content = content.strip() + "\n" + track_clean
-            if not content.strip(): new_content = "#EXTM3U\n" + track_clean
-            return self.save_file(m3u_path, new_content)
-        except: return False
+        track_clean = clean_track_path(track_path)
+        return self.store.mutate(m3u_path, lambda lines, members: (lines or ["#EXTM3U"]) + [track_clean])
 
     def pop_first_from_m3u(self, m3u_path):
-        try:
-            content = self.read_file(m3u_path)
-            if not content: return None
-            lines = [l.strip() for l in content.split('\n') if l.strip()]
+        popped = []
+        def pop(lines, members):
             valid_lines = [l for l in lines if not l.startswith('#')]
             if not valid_lines: return None
-            
-            first_track = valid_lines[0]
-            
+            popped.append(valid_lines[0])
             # Guardamos el resto
-            new_lines = ["#EXTM3U"] + valid_lines[1:]
-            new_content = "\n".join(new_lines)
-            self.save_file(m3u_path, new_content)
-            
-            return first_track
-        except: return None
+            return ["#EXTM3U"] + valid_lines[1:]
+        if not self.store.mutate(m3u_path, pop): return None
+        return popped[0] if popped else None
 
     def append_to_history(self, track_path):
         if not self.history_file: return
-        try:
-            content = self.read_file(self.history_file)
-            lines = [line.strip() for line in content.split('\n') if line.strip() and not line.startswith('#EXTM3U')]
-            track_clean = urllib.parse.unquote(track_path)
-            if "://" in track_clean:
-                track_clean = "/" + track_clean.split("://", 1)[1].split("/", 1)[1]
-            elif not track_clean.startswith("/"):
-                track_clean = "/" + track_clean
-            if lines and lines[0] == track_clean: return
-            lines.insert(0, track_clean)
-            lines = lines[:100]
-            new_content = "#EXTM3U\n" + "\n".join(lines)
-            self.save_file(self.history_file, new_content)
-        except: pass
-    
+        track_clean = clean_track_path(track_path)
+        def prepend(lines, members):
+            lines = [l for l in lines if not l.startswith('#EXTM3U')]
+            if lines and lines[0] == track_clean: return None
+            return ["#EXTM3U"] + ([track_clean] + lines)[:100]
+        self.store.mutate(self.history_file, prepend)
+
     def append_line_to_file(self, file_path, line):
-        try:
-            content = self.read_file(file_path)
-            clean_line = urllib.parse.unquote(line).strip()
-            existing_lines = [l.strip() for l in content.split('\n') if l.strip()]
-            if clean_line in existing_lines: return True
-            new_content = content.strip() + "\n" + clean_line
-            return self.save_file(file_path, new_content)
-        except: return False
+        clean_line = urllib.parse.unquote(line).strip()
+        key = self.store.member_key(clean_line)
+        def append(lines, members):
+            if key in members: return None
+            return lines + [clean_line]
+        return self.store.mutate(file_path, append)
+
+    def is_favorite_track(self, track_path):
+        return self.store.contains(self.favorites_file, track_path)
+
+    def is_favorite_album(self, album_path):
+        return self.store.contains(self.fav_albums_file, album_path)
 
 # --- MOTOR DE AUDIO (MPV) ---
+# Perfiles de buffer: caché del demuxer (MiB), segundos de lectura anticipada y timeout de red
+BUFFER_PROFILES = {
+    'lan': {'cache_mib': 16, 'readahead': 5, 'timeout': 10},
+    'wan': {'cache_mib': 128, 'readahead': 60, 'timeout': 30},
+}
+# En modo auto, a partir de este caudal medido se usa el perfil 'lan'
+AUTO_LAN_THROUGHPUT = 4 * 1024 * 1024
+
 class AudioPlayer:
-    def __init__(self):
-        self.player = mpv.MPV(input_default_bindings=True, input_vo_keyboard=True, ytdl=True)
+    def __init__(self, config: ConfigManager = None):
+        self.player = load_mpv().MPV(input_default_bindings=True, input_vo_keyboard=True, ytdl=True)
         self.player['vo'] = 'null'
         self.current_meta = {"title": " - ", "artist": " "}
         self.volume = 80
         self.player.volume = self.volume
 
+        get = config.get if config else (lambda key: "")
+        self.buffer_mode = (get('BUFFER_PROFILE') or 'auto').lower()
+        self.buffer_overrides = {}
+        for key, conf_key in (('cache_mib', 'DEMUXER_MAX_MIB'), ('readahead', 'READAHEAD_SECS'), ('timeout', 'NETWORK_TIMEOUT')):
+            try: self.buffer_overrides[key] = int(get(conf_key))
+            except ValueError: pass
+
+        # Telemetría de cortes (paused-for-cache) y vaciados del demuxer (underrun)
+        self._stats_lock = threading.Lock()
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.underruns = 0
+        self.throughput = 0.0
+        self._stall_started = None
+        self._in_underrun = False
+        self._track_stalls = 0
+        self.buffer_profile = None
+        self._apply_buffer_profile('wan' if self.buffer_mode == 'auto' else self.buffer_mode)
+        try:
+            self.player.observe_property('paused-for-cache', self._on_paused_for_cache)
+            self.player.observe_property('demuxer-cache-state', self._on_cache_state)
+            self.player.observe_property('cache-speed', self._on_cache_speed)
+        except Exception: pass
+
+    def _apply_buffer_profile(self, name):
+        profile = dict(BUFFER_PROFILES.get(name, BUFFER_PROFILES['wan']), **self.buffer_overrides)
+        try:
+            self.player['cache'] = 'yes'
+            self.player['demuxer-max-bytes'] = f"{profile['cache_mib']}MiB"
+            self.player['demuxer-readahead-secs'] = profile['readahead']
+            self.player['cache-secs'] = profile['readahead']
+            self.player['network-timeout'] = profile['timeout']
+            self.buffer_profile = name if name in BUFFER_PROFILES else 'wan'
+        except Exception: pass
+
+    def _choose_profile(self):
+        # El perfil se decide por pista: con cortes en la anterior nunca se baja a 'lan'
+        if self.buffer_mode != 'auto': return self.buffer_mode
+        with self._stats_lock:
+            if self._track_stalls: return 'wan'
+            return 'lan' if self.throughput >= AUTO_LAN_THROUGHPUT else 'wan'
+
+    def _on_paused_for_cache(self, _name, value):
+        with self._stats_lock:
+            if value and self._stall_started is None:
+                self.stalls += 1
+                self._track_stalls += 1
+                self._stall_started = time.monotonic()
+            elif not value and self._stall_started is not None:
+                self.stall_seconds += time.monotonic() - self._stall_started
+                self._stall_started = None
+
+    def _on_cache_state(self, _name, value):
+        underrun = bool(value and value.get('underrun'))
+        with self._stats_lock:
+            if underrun and not self._in_underrun: self.underruns += 1
+            self._in_underrun = underrun
+
+    def _on_cache_speed(self, _name, value):
+        if not value: return
+        with self._stats_lock:
+            self.throughput = value if not self.throughput else 0.8 * self.throughput + 0.2 * value
+
+    def buffer_summary(self, verbose=False):
+        with self._stats_lock:
+            if not verbose: return f"[Buf:{self.buffer_profile} Cortes:{self.stalls}]"
+            return (f"Buffer {self.buffer_profile} ({self.buffer_mode}) | Cortes: {self.stalls} ({self.stall_seconds:.1f}s)"
+                    f" | Underruns: {self.underruns} | {self.throughput / 1048576:.1f} MiB/s")
+
     def play(self, url, name):
         try:
+            profile = self._choose_profile()
+            if profile != self.buffer_profile: self._apply_buffer_profile(profile)
+            with self._stats_lock: self._track_stalls = 0
             self.player.play(url)
             self.current_meta["title"] = name
             self.player.volume = self.volume
@@ -435,6 +1597,42 @@ class FavAlbumsScreen(ModalScreen):
     @on(Button.Pressed, "#cancel_btn")
     def cancel(self): self.dismiss(None)
 
+class AppearsInScreen(ModalScreen):
+    CSS = """
+    AppearsInScreen { align: center middle; background: rgba(0,0,0,0.7); }
+    #dialog_appears { width: 50%; max-height: 75%; background: #262626; border: thick #005f87; padding: 1; }
+    #appears_header { background: #005f87; color: white; text-align: center; text-style: bold; padding: 0 1; margin-bottom: 1; }
+    OptionList { background: #1c1c1c; color: #b2b2b2; border: solid #3a3a3a; height: 1fr; }
+    OptionList:focus { border: solid #005f87; }
+    #btn_container { height: 3; align: center middle; margin-top: 1; }
+    Button { min-width: 16; height: 3; margin: 0 1; }
+    """
+    def __init__(self, track_name, playlists):
+        super().__init__()
+        self.track_name = track_name
+        self.playlists = playlists
+        self.display_names = [urllib.parse.unquote(p).split('/')[-1] for p in playlists]
+
+    def compose(self) -> ComposeResult:
+        with Vertical(id="dialog_appears"):
+            yield Label(f"Aparece en: {self.track_name}", id="appears_header")
+            yield OptionList(*self.display_names, id="appears_options")
+            with Horizontal(id="btn_container"):
+                yield Button("Quitar de todas", variant="warning", id="remove_all_btn")
+                yield Button("Cerrar", variant="error", id="cancel_btn")
+
+    def on_mount(self): self.query_one(OptionList).focus()
+
+    @on(OptionList.OptionSelected)
+    def on_select(self, event: OptionList.OptionSelected):
+        self.dismiss(('load', self.playlists[event.option_index]))
+
+    @on(Button.Pressed, "#remove_all_btn")
+    def remove_all(self): self.dismiss(('remove_all', None))
+
+    @on(Button.Pressed, "#cancel_btn")
+    def cancel(self): self.dismiss(None)
+
 class HelpScreen(ModalScreen):
     CSS = """
     HelpScreen { align: center middle; background: rgba(0,0,0,0.8); }
@@ -450,11 +1648,14 @@ class HelpScreen(ModalScreen):
     - **m**: Añadir canción a una lista.
     - **f**: Añadir a Favoritos.
     - **c**: Añadir a la COLA (archivo persistente).
+    - **i**: Listas en las que aparece la canción.
     - **Shift+C**: Limpiar la COLA.
 
     ## Navegación
     - **Enter (Carpeta)**: Expandir.
     - **Enter (Lista .m3u)**: Cargar lista.
+    - **/**: Buscar en la lista de la derecha (salta mientras escribes).
+    - **n / Shift+n**: Siguiente / Anterior coincidencia.
 
     ## Reproducción
     - **x / ESPACIO**: Play/Pause.
@@ -470,12 +1671,23 @@ class HelpScreen(ModalScreen):
     @on(Button.Pressed, "#close_help")
     def on_button_close(self): self.dismiss()
 
+# Hilos del pool compartido de cargas (álbumes, listas, subcarpetas, historial)
+LOADER_THREADS = 4
+
+# Árbol: nodos creados por página y agrupación A–Z a partir de este número de entradas
+TREE_PAGE_SIZE = 200
+TREE_GROUP_THRESHOLD = 1000
+
+def tree_bucket(name):
+    first = unicodedata.normalize('NFKD', name.lstrip())[:1].upper()
+    return first if 'A' <= first <= 'Z' else '#'
+
 class CmusStatusBar(Static):
     DEFAULT_CSS = "CmusStatusBar { dock: bottom; height: 1; background: #000000; color: #d7af00; text-style: bold; }"
-    def update_status(self, title, curr_ms, total_ms, volume, status, msg=""):
+    def update_status(self, title, curr_ms, total_ms, volume, status, msg="", buffer=""):
         def fmt(ms): return f"{int(max(0,ms)/1000)//60:02d}:{int(max(0,ms)/1000)%60:02d}"
         icon = ">" if status == "Playing" else ("||" if status == "Paused" else ".")
-        left = f"{icon} {fmt(curr_ms)}/{fmt(total_ms)} - {title} [Vol:{volume}%] [{status}]"
+        left = f"{icon} {fmt(curr_ms)}/{fmt(total_ms)} - {title} [Vol:{volume}%] [{status}] {buffer}"
         self.update(f"{left.ljust(60)} {msg}")
 
 class CmusApp(App):
@@ -526,6 +1738,8 @@ class CmusApp(App):
     #filter_input { background: #262626; border: none; height: 1; color: #d7af00; }
     #command_input { dock: bottom; height: 1; background: #303030; color: white; border: none; display: none; }
     #command_input.-visible { display: block; }
+    #search_input { dock: bottom; height: 1; background: #303030; color: #d7af00; border: none; display: none; }
+    #search_input.-visible { display: block; }
     Tree { width: 100%; height: 1fr; background: #1c1c1c; color: #b2b2b2; }
     Tree:focus { background: #262626; }
     Tree > .tree--cursor { background: #005f87; color: #ffffff; text-style: bold; } 
@@ -544,6 +1758,7 @@ class CmusApp(App):
         Binding("S", "sync_library", "Sync Library"),
         Binding("f", "add_favorite", "Add Favorite"), 
         Binding("F", "show_fav_albums", "Fav Albums"),
+        Binding("i", "show_appears_in", "Aparece en"),
         Binding("delete", "remove_from_playlist", "Remove"),
         Binding("D", "remove_from_playlist", "Remove"),
         Binding("space", "toggle_pause", "Pause"),
@@ -556,24 +1771,34 @@ class CmusApp(App):
         Binding("+", "vol_up", "Vol +"),
         Binding("-", "vol_down", "Vol -"),
         Binding(":", "command_mode", "Cmd"),
+        Binding("/", "search_playlist", "Buscar en la lista"),
+        Binding("n", "search_next", "Siguiente coincidencia"),
+        Binding("N", "search_prev", "Anterior coincidencia"),
         Binding("q", "quit", "Quit"),
         Binding("?", "help", "Help"),
     ]
 
-    def __init__(self):
+    def __init__(self, config_path="pymusic.conf", profiler=None):
         super().__init__()
-        self.config = ConfigManager()
+        self.profiler = profiler
+        self.config = ConfigManager(config_path)
         self.client = WebDAVClient(self.config)
-        self.player = AudioPlayer()
+        self.player = AudioPlayer(self.config)
         self.root_path = self.config.get('ROOT_PATH')
         self.playlists_dir = self.config.user_playlists_path
         self.active_playlist = []
+        self.playlist_search = PlaylistSearch(source=self.active_playlist)
+        self.search_query = ""
+        self.search_origin = 0
+        self.search_last = ("", None)
         self.current_track_index = -1
         self.root_items_cache = []
         self.status_message = ""
-        self.audio_exts = ('.mp3', '.ogg', '.flac', '.wav', '.m4a', '.opus')
+        self.audio_exts = AUDIO_EXTS
         self.current_loaded_path = None
         self.queue_offset = 0 
+        self.playlist_index = PlaylistIndex(self.client, [self.playlists_dir, self.root_path])
+        self.loader = BackgroundLoader(LOADER_THREADS)
 
     def compose(self) -> ComposeResult:
         with Container(id="main_container"):
@@ -584,6 +1809,7 @@ class CmusApp(App):
             yield DataTable(id="right_list", cursor_type="row")
         
         yield Input(id="command_input", placeholder=":comando")
+        yield Input(id="search_input", placeholder="/buscar en la lista")
         yield CmusStatusBar(id="status_bar")
 
     def on_mount(self):
@@ -593,6 +1819,9 @@ class CmusApp(App):
         tree.root.data = {'path': self.root_path, 'type': 'root'}
         tree.root.expand()
         self.load_tree_root()
+        self.load_favorites()
+        self.refresh_playlist_index()
+        self.set_interval(120, self.refresh_playlist_index)
         self.set_interval(0.5, self.update_status_bar)
         tree.focus()
 
@@ -607,6 +1836,7 @@ class CmusApp(App):
             pass
     
     def on_unmount(self):
+        self.loader.shutdown()
         self.player.close()
 
     def action_help(self): self.push_screen(HelpScreen())
@@ -634,22 +1864,45 @@ class CmusApp(App):
             idx = self.query_one(DataTable).cursor_row
             if idx is not None and 0 <= idx < len(self.active_playlist):
                 track = self.active_playlist[idx]
-                success = self.client.append_to_m3u(self.config.favorites_file, track['path'])
+                if self.client.is_favorite_track(track.path):
+                    self.call_from_thread(self.set_msg, "La canción ya está en Favoritos")
+                    return
+                success = self.client.append_to_m3u(self.config.favorites_file, track.path)
                 self.call_from_thread(self.set_msg, f"Canción añadida a Favoritos" if success else "Error añadiendo favorito")
+                if success: self.call_from_thread(self.refresh_playlist_view)
         elif self.query_one(Tree).has_focus:
             node = self.query_one(Tree).cursor_node
             if node and node.data.get('type') == 'dir':
                 path = node.data.get('path')
+                if self.client.is_favorite_album(path):
+                    self.call_from_thread(self.set_msg, "El álbum ya está en Favoritos")
+                    return
                 success = self.client.append_line_to_file(self.config.fav_albums_file, path)
                 self.call_from_thread(self.set_msg, f"Álbum añadido a Favoritos" if success else "Error añadiendo álbum")
+                if success: self.call_from_thread(node.set_label, self.node_label(node.data))
+
+    @work(thread=True)
+    def load_favorites(self):
+        # Precarga de Favoritos.m3u y albums.txt para marcar la interfaz sin usar la red
+        self.client.store.get(self.config.favorites_file)
+        self.client.store.get(self.config.fav_albums_file)
+        self.call_from_thread(self.refresh_playlist_view)
+        self.call_from_thread(self.relabel_tree)
+
+    def relabel_tree(self):
+        pending = list(self.query_one(Tree).root.children)
+        while pending:
+            node = pending.pop()
+            if node.data and node.data.get('type') == 'dir': node.set_label(self.node_label(node.data))
+            pending.extend(node.children)
 
     @work(thread=True)
     def action_show_fav_albums(self):
-        content = self.client.read_file(self.config.fav_albums_file)
-        if not content:
+        albums = self.client.store.get(self.config.fav_albums_file)
+        if not albums or not albums.lines:
             self.call_from_thread(self.set_msg, "No hay álbumes favoritos aún.")
             return
-        lines = [l.strip() for l in content.split('\n') if l.strip()]
+        lines = albums.entries
         if not lines:
              self.call_from_thread(self.set_msg, "Lista de álbumes vacía.")
              return
@@ -657,6 +1910,40 @@ class CmusApp(App):
             self.push_screen(FavAlbumsScreen(lines), self.on_album_selected)
         self.call_from_thread(show_modal)
 
+    @work(thread=True, exclusive=True, group="playlist_index")
+    def refresh_playlist_index(self):
+        self.playlist_index.refresh()
+
+    def action_show_appears_in(self):
+        table = self.query_one(DataTable)
+        idx = table.cursor_row if table.has_focus else self.current_track_index
+        if idx is None or not 0 <= idx < len(self.active_playlist): return
+        if not self.playlist_index.ready:
+            self.set_msg("Índice de listas en construcción...")
+            return
+        track = self.active_playlist[idx]
+        playlists = self.playlist_index.playlists_for(track.path)
+        if not playlists:
+            self.set_msg("La pista no aparece en ninguna lista")
+            return
+        def on_choice(choice):
+            if not choice: return
+            action, path = choice
+            if action == 'load':
+                self.set_msg("Cargando lista...")
+                self.active_playlist = []
+                self.load_playlist_content(path, append=False)
+                self.current_loaded_path = path
+            elif action == 'remove_all':
+                self.remove_from_all_playlists(track)
+        self.push_screen(AppearsInScreen(track.name, playlists), on_choice)
+
+    @work(thread=True)
+    def remove_from_all_playlists(self, track):
+        removed = self.playlist_index.remove_everywhere(track.path)
+        self.call_from_thread(self.set_msg, f"Quitada de {removed} listas")
+        self.call_from_thread(self.refresh_playlist_view)
+
     def on_album_selected(self, album_path):
         if album_path:
             self.set_msg(f"Cargando álbum favorito...")
@@ -681,7 +1968,7 @@ class CmusApp(App):
                     self.current_loaded_path = playlist['path']
                 elif mode == "add" and hasattr(self, 'temp_track_to_add'):
                     self.set_msg(f"Añadiendo a {playlist['name']}...")
-                    self.do_append_to_m3u(playlist['path'], self.temp_track_to_add['path'])
+                    self.do_append_to_m3u(playlist['path'], self.temp_track_to_add.path)
 
         self.push_screen(PlaylistSelectionScreen(self.client, path, mode), on_selected)
 
@@ -704,6 +1991,10 @@ class CmusApp(App):
         node = event.node
         path = node.data.get('path')
         dtype = node.data.get('type')
+        if dtype == 'more':
+            self.expand_more_node(node)
+            return
+        if dtype == 'bucket': return
         
         self.current_loaded_path = path
 
@@ -743,6 +2034,12 @@ class CmusApp(App):
                     node.expand()
                     self.on_tree_select(Tree.NodeSelected(node))
 
+            elif dtype == 'bucket':
+                node.toggle()
+
+            elif dtype == 'more':
+                self.expand_more_node(node)
+
             elif dtype == 'playlist':
                 if self.current_loaded_path == node_path:
                     table = self.query_one(DataTable)
@@ -767,15 +2064,15 @@ class CmusApp(App):
         if self.query_one(DataTable).has_focus:
             idx = self.query_one(DataTable).cursor_row
             if idx is not None and 0 <= idx < len(self.active_playlist):
-                track_to_add = self.active_playlist[idx].copy()
+                track_to_add = self.active_playlist[idx]
         elif self.query_one(Tree).has_focus:
             node = self.query_one(Tree).cursor_node
             if node and node.data.get('type') != 'dir':
                  pass
         
         if track_to_add:
-            success = self.client.append_to_m3u(self.config.queue_file, track_to_add['path'])
-            self.call_from_thread(self.set_msg, f"Añadido a 'en_cola': {track_to_add['name']}" if success else "Error añadiendo a cola")
+            success = self.client.append_to_m3u(self.config.queue_file, track_to_add.path)
+            self.call_from_thread(self.set_msg, f"Añadido a 'en_cola': {track_to_add.name}" if success else "Error añadiendo a cola")
 
     @work(thread=True)
     def action_clear_queue(self):
@@ -787,7 +2084,9 @@ class CmusApp(App):
         table = self.query_one(DataTable)
         idx = table.cursor_row
         if idx is not None and 0 <= idx < len(self.active_playlist):
+            search = self.current_search()
             del self.active_playlist[idx]
+            search.remove(idx)
             if idx < self.current_track_index: self.current_track_index -= 1
             self.refresh_playlist_view()
             self.set_msg("Pista eliminada de la vista")
@@ -822,16 +2121,32 @@ class CmusApp(App):
                 self.load_playlist_content(path, append=False)
                 self.current_loaded_path = path
         elif cmd == ":clear": self.action_clear_playlist()
+        elif cmd == ":stats": self.set_msg(f"{self.client.coalesce_stats()} | {self.player.buffer_summary(verbose=True)}")
+        elif cmd == ":fuentes":
+            if isinstance(self.client.backend, FederatedBackend): self.set_msg(self.client.backend.latency_summary())
+            else: self.set_msg("Una sola fuente configurada")
+        elif cmd == ":profile":
+            if self.profiler: self.write_profile()
+            else: self.set_msg("Perfilado desactivado: arranca con --profile o PYMUSIC_PROFILE=1")
         elif cmd == ":q": self.exit()
         else: self.set_msg(f"Comando desconocido: {cmd}")
 
+    @work(thread=True)
+    def write_profile(self):
+        # La instantánea de tracemalloc puede tardar: fuera del bucle de la interfaz
+        try: paths = self.profiler.write()
+        except OSError as e:
+            self.call_from_thread(self.set_msg, f"Error guardando el perfil: {e}")
+            return
+        self.call_from_thread(self.set_msg, f"Perfil guardado: {paths[0]}")
+
     @work(thread=True)
     def save_playlist(self, name):
         if not name.endswith('.m3u'): name += '.m3u'
         path = self.playlists_dir + name
         content = "#EXTM3U\n"
         for track in self.active_playlist:
-            full_path = track['path']
+            full_path = track.path
             if full_path.startswith(self.root_path):
                 rel = full_path[len(self.root_path):]
                 if rel.startswith('/'): rel = rel[1:]
@@ -840,8 +2155,16 @@ class CmusApp(App):
         success = self.client.save_file(path, content)
         self.call_from_thread(self.set_msg, f"Guardado en {self.config.user or 'general'}: {name}" if success else "Error al guardar")
 
-    @work(thread=True)
+    def call_if_current(self, token, fn, *args):
+        """Aplica fn en el hilo de la interfaz solo si la carga no ha sido sustituida."""
+        def apply():
+            if not token.cancelled: fn(*args)
+        self.call_from_thread(apply)
+
     def load_playlist_content(self, path, append=False):
+        self.loader.submit(None if append else 'playlist', self._load_playlist_content, path, append)
+
+    def _load_playlist_content(self, token, path, append):
         content = self.client.read_file(path)
         if not content: return
         lines = content.split('\n')
@@ -853,21 +2176,22 @@ class CmusApp(App):
             full_path_for_play = line
             if not line.startswith("http") and not line.startswith("/"):
                 full_path_for_play = root_prefix + line
-            decoded = urllib.parse.unquote(full_path_for_play)
-            parts = decoded.rstrip('/').split('/')
-            new_tracks.append({'name': parts[-1], 'path': full_path_for_play, 'album': parts[-2] if len(parts)>1 else "-"})
+            new_tracks.append(Track.from_path(full_path_for_play))
+        keys = search_keys(new_tracks)
         def finish():
             if not append: 
-                self.active_playlist = new_tracks
+                self.replace_active_playlist(new_tracks, keys)
                 self.current_track_index = 0
             else: 
-                self.active_playlist.extend(new_tracks)
+                self.extend_active_playlist(new_tracks, keys)
             self.refresh_playlist_view()
             self.set_msg(f"Lista cargada: {len(new_tracks)} pistas")
-        self.call_from_thread(finish)
+        self.call_if_current(token, finish)
 
-    @work(thread=True)
     def add_tracks_recursive(self, path, is_dir, append=False):
+        self.loader.submit(None if append else 'playlist', self._add_tracks_recursive, path, is_dir, append)
+
+    def _add_tracks_recursive(self, token, path, is_dir, append):
         new_tracks = []
         if is_dir:
             items = self.client.list_directory(path)
@@ -875,41 +2199,146 @@ class CmusApp(App):
             album_name = decoded_path.split('/')[-1]
             for i in items:
                 if not i['is_dir'] and i['name'].lower().endswith(self.audio_exts):
-                    new_tracks.append({'name': urllib.parse.unquote(i['name']), 'path': i['path'], 'album': album_name})
+                    new_tracks.append(Track(i['path'], urllib.parse.unquote(i['name']), album_name))
+        keys = search_keys(new_tracks)
         def update_ui():
             if not append: 
-                self.active_playlist = new_tracks
+                self.replace_active_playlist(new_tracks, keys)
                 self.current_track_index = 0
-            else: self.active_playlist.extend(new_tracks)
+            else: self.extend_active_playlist(new_tracks, keys)
             self.refresh_playlist_view()
             if not append and new_tracks: self.set_msg(f"Cargadas {len(new_tracks)} canciones")
-        self.call_from_thread(update_ui)
+        self.call_if_current(token, update_ui)
+
+    def node_label(self, data):
+        return f"📁 ⭐ {data['name']}" if self.client.is_favorite_album(data['path']) else f"📁 {data['name']}"
+
+    # --- BÚSQUEDA EN LA LISTA ---
+    # Las cargas calculan las claves en su hilo; el índice se actualiza junto a active_playlist
+    def replace_active_playlist(self, tracks, keys):
+        self.active_playlist = tracks
+        self.playlist_search = PlaylistSearch(keys, tracks)
+
+    def extend_active_playlist(self, tracks, keys):
+        search = self.current_search()
+        self.active_playlist.extend(tracks)
+        search.extend(keys)
+
+    def current_search(self):
+        # Si la lista se sustituyó por otra vía (vaciar, cargar...) el índice se reconstruye aquí
+        search = self.playlist_search
+        if search.source is not self.active_playlist or len(search) != len(self.active_playlist):
+            search = self.playlist_search = PlaylistSearch(search_keys(self.active_playlist), self.active_playlist)
+        return search
+
+    def action_search_playlist(self):
+        table = self.query_one(DataTable)
+        self.search_origin = table.cursor_row or 0
+        self.search_last = ("", None)
+        inp = self.query_one("#search_input")
+        inp.add_class("-visible")
+        inp.value = ""
+        inp.focus()
+
+    @on(Input.Changed, "#search_input")
+    def on_search_change(self, event: Input.Changed):
+        query = event.value
+        if not query: return
+        last_query, last_row = self.search_last
+        # Alargar la búsqueda solo puede mover la coincidencia hacia delante
+        if last_query and query.startswith(last_query):
+            row = None if last_row is None else self.current_search().find(query, last_row)
+        else: row = self.current_search().find(query, self.search_origin)
+        self.search_last = (query, row)
+        if row is None: self.set_msg(f"/{query}: sin coincidencias")
+        else:
+            self.query_one(DataTable).move_cursor(row=row)
+            self.set_msg(f"/{query}: pista {row + 1}")
+
+    @on(Input.Submitted, "#search_input")
+    def on_search_submit(self, event: Input.Submitted):
+        inp = self.query_one("#search_input")
+        inp.remove_class("-visible")
+        inp.value = ""
+        self.query_one(DataTable).focus()
+        if event.value:
+            self.search_query = event.value
+            total = self.current_search().count(event.value)
+            self.set_msg(f"/{event.value}: {total} coincidencias (n/N para recorrerlas)")
+
+    def action_search_next(self): self.cycle_search(reverse=False)
+
+    def action_search_prev(self): self.cycle_search(reverse=True)
+
+    def cycle_search(self, reverse):
+        if not self.search_query: return
+        table = self.query_one(DataTable)
+        cursor = table.cursor_row or 0
+        row = self.current_search().find(self.search_query, cursor if reverse else cursor + 1, reverse=reverse)
+        if row is None: self.set_msg(f"/{self.search_query}: sin coincidencias")
+        else: table.move_cursor(row=row)
 
     def refresh_playlist_view(self):
         table = self.query_one(DataTable)
         table.clear()
-        for t in self.active_playlist: table.add_row(t['album'], t['name'])
+        is_fav = self.client.is_favorite_track
+        for t in self.active_playlist: table.add_row(t.album, f"★ {t.name}" if is_fav(t.path) else t.name)
         if 0 <= self.current_track_index < len(self.active_playlist):
             try: table.move_cursor(row=self.current_track_index)
             except: pass
 
-    @work(thread=True)
     def load_tree_root(self):
+        self.loader.submit('root', self._load_tree_root)
+
+    def _load_tree_root(self, token):
         items = self.client.list_directory(self.root_path)
-        self.root_items_cache = items
-        self.call_from_thread(self.filter_tree, "")
+        def update():
+            self.root_items_cache = items
+            self.filter_tree("")
+        self.call_if_current(token, update)
 
     def filter_tree(self, filter_text):
         tree = self.query_one(Tree)
         root = tree.root
         root.remove_children()
         term = filter_text.lower()
-        for item in self.root_items_cache:
-            name = item['name']
-            if term and term not in name.lower(): continue
-            clean = urllib.parse.unquote(name)
-            if item['is_dir']: root.add(f"📁 {clean}", data={'path': item['path'], 'type': 'dir'}, allow_expand=True)
-            elif name.lower().endswith('.m3u'): root.add(f"📜 {clean}", data={'path': item['path'], 'type': 'playlist'}, allow_expand=False)
+        self.populate_node(root, [i for i in self.root_items_cache if not term or term in i['name'].lower()])
+
+    # --- ÁRBOL PAGINADO ---
+    # Los nodos se crean por páginas; las carpetas enormes se agrupan por inicial
+    def populate_node(self, node, items):
+        items = [i for i in items if i['is_dir'] or i['name'].lower().endswith('.m3u')]
+        if len(items) <= TREE_GROUP_THRESHOLD:
+            self.add_node_page(node, items, 0)
+            return
+        buckets = {}
+        for item in items:
+            buckets.setdefault(tree_bucket(urllib.parse.unquote(item['name'])), []).append(item)
+        for letter in sorted(buckets, key=lambda k: (k == '#', k)):
+            group = buckets[letter]
+            node.add(f"🔤 {letter} ({len(group)})", data={'type': 'bucket', 'items': group}, allow_expand=True)
+
+    def add_node_page(self, node, items, offset):
+        for item in items[offset:offset + TREE_PAGE_SIZE]:
+            clean = urllib.parse.unquote(item['name'])
+            if item['is_dir']:
+                data = {'path': item['path'], 'type': 'dir', 'name': clean}
+                node.add(self.node_label(data), data=data, allow_expand=True)
+            else: node.add(f"📜 {clean}", data={'path': item['path'], 'type': 'playlist'}, allow_expand=False)
+        remaining = len(items) - offset - TREE_PAGE_SIZE
+        if remaining > 0:
+            node.add(f"… {remaining} más", data={'type': 'more', 'items': items, 'offset': offset + TREE_PAGE_SIZE}, allow_expand=False)
+
+    def expand_more_node(self, node):
+        parent, data = node.parent, node.data
+        if parent is None or data.get('type') != 'more': return
+        node.remove()
+        self.add_node_page(parent, data['items'], data['offset'])
+
+    @on(Tree.NodeHighlighted)
+    def on_tree_highlight(self, event: Tree.NodeHighlighted):
+        # Al llegar con el cursor al final de la página se carga la siguiente
+        if event.node.data and event.node.data.get('type') == 'more': self.expand_more_node(event.node)
 
     @on(Input.Changed, "#filter_input")
     def on_filter_change(self, event: Input.Changed): self.filter_tree(event.value)
@@ -925,19 +2354,26 @@ class CmusApp(App):
 
     @on(Tree.NodeExpanded)
     def on_tree_expand(self, event: Tree.NodeExpanded):
-        if event.node != self.query_one(Tree).root: self.load_sub_node(event.node)
+        node = event.node
+        if node == self.query_one(Tree).root: return
+        if node.data.get('type') == 'bucket':
+            if not node.children: self.add_node_page(node, node.data['items'], 0)
+        else: self.load_sub_node(node)
+
+    @on(Tree.NodeCollapsed)
+    def on_tree_collapse(self, event: Tree.NodeCollapsed):
+        self.loader.cancel(('node', id(event.node)))
 
-    @work(thread=True)
     def load_sub_node(self, node: TreeNode):
         if node.children: return
+        self.loader.submit(('node', id(node)), self._load_sub_node, node)
+
+    def _load_sub_node(self, token, node):
         items = self.client.list_directory(node.data['path'])
         def update():
             node.remove_children()
-            for item in items:
-                clean = urllib.parse.unquote(item['name'])
-                if item['is_dir']: node.add(f"📁 {clean}", data={'path': item['path'], 'type': 'dir'}, allow_expand=True)
-                elif clean.lower().endswith('.m3u'): node.add(f"📜 {clean}", data={'path': item['path'], 'type': 'playlist'})
-        self.call_from_thread(update)
+            self.populate_node(node, items)
+        self.call_if_current(token, update)
 
     def play_index(self, index):
         if 0 <= index < len(self.active_playlist):
@@ -946,7 +2382,7 @@ class CmusApp(App):
             
             # --- Lógica LOCAL_PATH vs WEBDAV ---
             path_or_url = ""
-            raw_path = item['path']
+            raw_path = item.path
             
             if self.config.local_path:
                 clean_root = self.root_path.rstrip('/')
@@ -961,8 +2397,8 @@ class CmusApp(App):
             else:
                 path_or_url = self.client.get_stream_url(raw_path)
 
-            threading.Thread(target=self.client.append_to_history, args=(raw_path,), daemon=True).start()
-            self.player.play(path_or_url, item['name'])
+            self.loader.submit(None, lambda token, path: self.client.append_to_history(path), raw_path)
+            self.player.play(path_or_url, item.name)
             try: self.query_one(DataTable).move_cursor(row=index)
             except: pass
 
@@ -1026,8 +2462,591 @@ class CmusApp(App):
     def update_status_bar(self):
         curr, total, vol, status = self.player.get_status()
         if status == "Ended": self.action_next_track()
-        self.query_one(CmusStatusBar).update_status(self.player.current_meta["title"], curr, total, vol, status, self.status_message)
+        self.query_one(CmusStatusBar).update_status(self.player.current_meta["title"], curr, total, vol, status, self.status_message, self.player.buffer_summary())
+
+# --- PERFILADO ---
+PROFILE_DIR = "pymusic-profile"
+
+
+class SamplingProfiler:
+    """Perfilador por muestreo de todos los hilos con instantáneas de tracemalloc.
+
+    Un hilo propio anota cada interval segundos la pila de los demás (sys._current_frames).
+    write() vuelca lo acumulado desde el arranque en formato collapsed ("hilo;func (fichero:línea);... N",
+    válido para flamegraph.pl y speedscope) y el top de asignaciones, con el crecimiento
+    respecto al volcado anterior.
+    """
+    def __init__(self, directory, interval=0.005, memory_frames=16):
+        self.directory = directory
+        self.interval = interval
+        self.memory_frames = memory_frames
+        self.samples = {}
+        self.ticks = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._previous = None
+        self._seq = 0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.memory_frames and not tracemalloc.is_tracing(): tracemalloc.start(self.memory_frames)
+        else: self.memory_frames = 0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        labels = {}
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own: continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    parts.append(label)
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                stacks.append(";".join(reversed(parts)))
+            with self._lock:
+                for stack in stacks: self.samples[stack] = self.samples.get(stack, 0) + 1
+                self.ticks += 1
+
+    def write(self):
+        """Escribe los ficheros del perfil y devuelve sus rutas; el muestreo sigue en marcha."""
+        with self._lock:
+            self._seq += 1
+            samples = sorted(self.samples.items(), key=lambda kv: -kv[1])
+        base = os.path.join(self.directory, f"pymusic-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}-{self._seq}")
+        paths = [base + ".collapsed"]
+        with open(paths[0], 'w', encoding='utf-8') as f:
+            for stack, count in samples: f.write(f"{stack} {count}\n")
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            current, peak = tracemalloc.get_traced_memory()
+            paths.append(base + ".tracemalloc.txt")
+            with open(paths[1], 'w', encoding='utf-8') as f:
+                f.write(f"# Memoria trazada: {current / 1048576:.1f} MiB (pico {peak / 1048576:.1f} MiB)\n# Top por línea\n")
+                for stat in snapshot.statistics('lineno')[:40]: f.write(f"{stat}\n")
+                if self._previous is not None:
+                    f.write("\n# Crecimiento desde el volcado anterior\n")
+                    for stat in snapshot.compare_to(self._previous, 'lineno')[:40]: f.write(f"{stat}\n")
+            self._previous = snapshot
+        return paths
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join()
+        paths = self.write()
+        if self.memory_frames: tracemalloc.stop()
+        self._previous = None
+        return paths
+
+
+def profiler_from_env(directory=None):
+    """Perfilador pedido con --profile o PYMUSIC_PROFILE (directorio de salida, o 1 para el predeterminado)."""
+    directory = directory or os.environ.get('PYMUSIC_PROFILE')
+    if not directory or directory == '0': return None
+    if directory == '1': directory = PROFILE_DIR
+    try: interval = float(os.environ.get('PYMUSIC_PROFILE_INTERVAL_MS') or 5) / 1000
+    except ValueError: interval = 0.005
+    return SamplingProfiler(directory, interval=interval)
+
+
+# --- LÍNEA DE COMANDOS (SIN INTERFAZ) ---
+def walk_library(backend, root_path, workers=8, listings=None):
+    """Recorre un backend con listados en paralelo; devuelve (ficheros, errores).
+
+    Si se pasa listings, se guarda en él el listado de cada carpeta recorrida.
+    """
+    files, errors = [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(backend.list_directory, root_path): root_path}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                try: items = future.result()
+                except StorageError as e:
+                    errors.append({'dir': directory, 'error': str(e)})
+                    continue
+                if listings is not None: listings[directory] = items
+                for item in items:
+                    if item['is_dir']: pending[pool.submit(backend.list_directory, item['path'])] = item['path']
+                    else: files.append(item)
+    return files, errors
+
+
+def crawl_library(client, root_path, workers=8):
+    """Recorre la biblioteca con PROPFIND en paralelo.
+
+    Devuelve (ficheros, listas, errores): ficheros es {clave normalizada: item},
+    listas los items .m3u encontrados y errores las carpetas que no se pudieron leer.
+    """
+    items, errors = walk_library(client.backend, root_path, workers)
+    files = {client.store.member_key(item['path']): item for item in items}
+    playlists = [item for item in items if item['name'].lower().endswith('.m3u')]
+    return files, playlists, errors
+
+
+def _m3u_items(items):
+    return [i for i in items if not i['is_dir'] and i['name'].lower().endswith('.m3u')]
+
+
+def check_playlists(client, config, crawl=True, fix=False, workers=16):
+    """Comprueba todas las entradas de las listas .m3u y, con fix, corrige las que tengan un único candidato."""
+    started = time.monotonic()
+    store = client.store
+    root_path = config.get('ROOT_PATH') or '/'
+    root_prefix = store.root_prefix
+    errors = []
+    if crawl:
+        library, playlists, errors = crawl_library(client, root_path, workers)
+    else:
+        library, playlists = None, []
+        try: playlists = _m3u_items(client.backend.list_directory(root_path))
+        except StorageError as e: errors.append({'dir': root_path, 'error': str(e)})
+    known = {client._key(p['path']) for p in playlists}
+    try:
+        playlists += [p for p in _m3u_items(client.backend.list_directory(config.user_playlists_path)) if client._key(p['path']) not in known]
+    except StorageError as e: errors.append({'dir': config.user_playlists_path, 'error': str(e)})
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        parsed = list(pool.map(lambda p: store.get(p['path']), playlists))
+
+        # Solo se consulta al servidor lo que el índice de la biblioteca no puede responder
+        missing = set()
+        for playlist in parsed:
+            for entry in (playlist.entries if playlist else []):
+                key = store.member_key(entry)
+                if library is None or key not in library: missing.add(key)
+        if library is not None and not errors:
+            missing = {k for k in missing if not k.startswith(root_prefix)}
+
+        def probe(key):
+            try: return key, client.backend.exists(key)
+            except StorageError: return key, None
+        probed = dict(pool.map(probe, missing))
+
+    by_name = {}
+    for key in (library or {}):
+        by_name.setdefault(key.rsplit('/', 1)[-1].lower(), []).append(key)
+
+    broken, unreachable, replacements = [], [], {}
+    total_entries = 0
+    for item, playlist in zip(playlists, parsed):
+        if playlist is None:
+            errors.append({'playlist': item['path'], 'error': "no se pudo leer"})
+            continue
+        line_no = 0
+        for line in playlist.lines:
+            line_no += 1
+            if line.startswith('#'): continue
+            total_entries += 1
+            key = store.member_key(line)
+            if library is not None and key in library: continue
+            state = probed.get(key, False)
+            if state: continue
+            if state is None:
+                unreachable.append({'playlist': item['path'], 'line': line_no, 'entry': line})
+                continue
+            candidates = by_name.get(key.rsplit('/', 1)[-1].lower(), [])
+            suggestion = candidates[0] if len(candidates) == 1 else None
+            if suggestion and "://" not in line and not line.startswith('/'):
+                suggestion = suggestion[len(root_prefix):]
+            broken.append({'playlist': item['path'], 'line': line_no, 'entry': line, 'suggestion': suggestion})
+            if suggestion: replacements.setdefault(item['path'], {})[line] = suggestion
+
+    fixed = 0
+    if fix:
+        for path, mapping in replacements.items():
+            if store.mutate(path, lambda lines, members: [mapping.get(l, l) for l in lines]):
+                fixed += len(mapping)
+
+    return {
+        'playlists': len(playlists),
+        'entries': total_entries,
+        'broken': broken,
+        'unreachable': unreachable,
+        'fixed': fixed,
+        'errors': errors,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+
+
+# Duplicados: se comparan el tamaño y un hash de tres trozos (inicio, mitad y final)
+DEDUP_CHUNK = 64 * 1024
+
+def _chunk_offsets(size):
+    if size <= 3 * DEDUP_CHUNK: return [(0, size)]
+    return [(0, DEDUP_CHUNK), (size // 2 - DEDUP_CHUNK // 2, DEDUP_CHUNK), (size - DEDUP_CHUNK, DEDUP_CHUNK)]
+
+
+def _hash_chunks(size, chunks):
+    digest = hashlib.sha256(str(size).encode())
+    for chunk in chunks: digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_duplicates(client, config, workers=8, processes=None, cache_path=None):
+    """Agrupa ficheros de audio idénticos: candidatos por tamaño, confirmados con Range + hash.
+
+    Los hashes se guardan en cache_path por ruta y ETag, así un nuevo análisis solo
+    descarga los trozos de los ficheros que han cambiado.
+    """
+    started = time.monotonic()
+    files, _playlists, errors = crawl_library(client, config.get('ROOT_PATH') or '/', workers)
+    by_size = {}
+    for key, item in files.items():
+        if item.get('size') and item['name'].lower().endswith(AUDIO_EXTS):
+            by_size.setdefault(item['size'], []).append(key)
+    candidates = [key for keys in by_size.values() if len(keys) > 1 for key in keys]
+
+    cache = {}
+    if cache_path:
+        try:
+            with open(cache_path, encoding='utf-8') as f: cache = json.load(f)
+        except (OSError, ValueError): cache = {}
+    hashes, todo = {}, []
+    for key in candidates:
+        item, cached = files[key], cache.get(key)
+        if cached and item.get('etag') and cached.get('etag') == item['etag'] and cached.get('size') == item['size']:
+            hashes[key] = cached['hash']
+        else: todo.append(key)
+
+    def fetch(key):
+        item = files[key]
+        return key, [client.backend.read_range(item['path'], start, length) for start, length in _chunk_offsets(item['size'])]
+
+    # Las descargas van en hilos y el hash en procesos, sin que uno espere al otro.
+    # 'spawn': hacer fork con hilos vivos (descargas, inotify, sesión HTTP) puede bloquear al hijo
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as threads, \
+         concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as procs:
+        hashing = []
+        futures = {threads.submit(fetch, key): key for key in todo}
+        for future in concurrent.futures.as_completed(futures):
+            try: key, chunks = future.result()
+            except StorageError as e:
+                errors.append({'file': futures[future], 'error': str(e)})
+                continue
+            hashing.append((key, procs.submit(_hash_chunks, files[key]['size'], chunks)))
+        for key, future in hashing: hashes[key] = future.result()
+
+    if cache_path:
+        fresh = {k: v for k, v in cache.items() if k in files}
+        fresh.update({k: {'etag': files[k].get('etag'), 'size': files[k]['size'], 'hash': h} for k, h in hashes.items()})
+        try:
+            tmp = cache_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(fresh, f, ensure_ascii=False)
+            os.replace(tmp, cache_path)
+        except OSError as e: errors.append({'cache': cache_path, 'error': str(e)})
+
+    groups = {}
+    for key, digest in hashes.items():
+        groups.setdefault((files[key]['size'], digest), []).append(key)
+    duplicates = [{'size': size, 'hash': digest, 'files': sorted(keys)}
+                  for (size, digest), keys in groups.items() if len(keys) > 1]
+    duplicates.sort(key=lambda g: g['size'] * (len(g['files']) - 1), reverse=True)
+    return {
+        'scanned': len(files),
+        'candidates': len(candidates),
+        'hashed': len(todo),
+        'groups': duplicates,
+        'wasted_bytes': sum(g['size'] * (len(g['files']) - 1) for g in duplicates),
+        'errors': errors,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+
+
+def save_duplicates_playlist(client, config, name, groups):
+    if not name.endswith('.m3u'): name += '.m3u'
+    lines = ["#EXTM3U"]
+    for n, group in enumerate(groups, 1):
+        lines.append(f"# Duplicados {n}: {len(group['files'])} copias de {group['size']} bytes")
+        lines.extend(group['files'])
+    path = config.user_playlists_path + name
+    return path if client.save_file(path, "\n".join(lines) + "\n") else None
+
+
+MANIFEST_VERSION = 2
+
+
+def build_manifest(client, config, workers=8):
+    """Recorre la biblioteca en vivo y sube el manifiesto comprimido a la ruta MANIFEST."""
+    started = time.time()
+    backend = client.backend.live if isinstance(client.backend, ManifestBackend) else client.backend
+    root = config.get('ROOT_PATH') or '/'
+    # Con el reloj del servidor: es con el que se comparan las fechas de las carpetas
+    try: generated = backend.server_time(root)
+    except StorageError: generated = started
+    listings = {}
+    files, errors = walk_library(backend, root, workers, listings)
+    def entry(i):
+        modified = http_date(i.get('modified'))
+        return [i['name'], int(i['is_dir']), i.get('size'), i.get('etag'), None if modified is None else int(modified)]
+    dirs = {urllib.parse.unquote(path).rstrip('/') + '/': [entry(i) for i in items] for path, items in listings.items()}
+    manifest = {'version': MANIFEST_VERSION, 'generated': int(generated), 'root': root, 'dirs': dirs}
+    data = gzip.compress(json.dumps(manifest, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), mtime=0)
+    # Con errores el manifiesto quedaría incompleto: no se sube
+    saved = not errors and backend.save_bytes(config.get('MANIFEST'), data, 'application/gzip')
+    return {'dirs': len(dirs), 'files': len(files), 'bytes': len(data), 'saved': bool(saved),
+            'errors': errors, 'seconds': round(time.time() - started, 2)}
+
+
+# --- ESPEJO LOCAL ---
+SYNC_STATE = '.pymusic_sync.json'
+
+
+class RateLimiter:
+    """Cubo de tokens compartido por todas las descargas: limita el caudal total a rate bytes/s."""
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.allowance = self.rate
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __call__(self, nbytes):
+        with self._lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.stamp) * self.rate) - nbytes
+            self.stamp = now
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait: time.sleep(wait)
+
+
+def _remote_version(item):
+    # Sin ETag se compara tamaño y fecha de modificación
+    return item.get('etag') or f"{item.get('size')}-{item.get('modified')}"
+
+
+def _remote_mtime(item):
+    return http_date(item.get('modified'))
+
+
+def sync_mirror(config, workers=4, bandwidth=None, delete=True, max_delete=0.1, dry_run=False):
+    """Sincroniza LOCAL_PATH con el servidor WebDAV principal.
+
+    Solo se descarga lo nuevo o cambiado (ETag, o tamaño y fecha) y las descargas cortadas
+    se reanudan con Range + If-Range. Solo se borran ficheros que trajo una sincronización
+    anterior y que nadie ha tocado en local, y nunca si el recorrido remoto falló o los
+    borrados superan la fracción max_delete de lo sincronizado. Un fichero local sin estado
+    (copiado a mano) se adopta sin descargarlo si coincide en tamaño y no es más antiguo.
+    """
+    started = time.monotonic()
+    remote = WebDAVBackend(config)
+    root = urllib.parse.unquote(config.get('ROOT_PATH') or '/').rstrip('/')
+    local_root = config.local_path.rstrip('/') or '/'
+    state_path = os.path.join(local_root, SYNC_STATE)
+    try:
+        with open(state_path, encoding='utf-8') as f: state = json.load(f)
+    except (OSError, ValueError): state = {}
+    known, partial = state.get('files', {}), state.get('partial', {})
+    lock = threading.Lock()
+
+    def save_state():
+        with lock: data = json.dumps({'files': known, 'partial': partial}, ensure_ascii=False)
+        tmp = state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f: f.write(data)
+        os.replace(tmp, state_path)
+
+    items, errors = walk_library(remote, config.get('ROOT_PATH') or '/', workers)
+    wanted = {}
+    for item in items:
+        decoded = urllib.parse.unquote(item['path'])
+        if "://" in decoded: decoded = "/" + decoded.split("://", 1)[1].split("/", 1)[1]
+        if decoded.startswith(root + '/'): wanted[decoded[len(root) + 1:]] = item
+
+    adopted = []
+
+    def up_to_date(rel, item):
+        entry = known.get(rel)
+        if entry and entry['version'] != _remote_version(item): return False
+        try: st = os.stat(os.path.join(local_root, rel))
+        except OSError: return False
+        if entry: return (st.st_size, st.st_mtime_ns) == (entry['size'], entry['mtime_ns'])
+        # getlastmodified tiene resolución de segundos
+        modified = _remote_mtime(item)
+        if modified is None or st.st_size != item.get('size') or st.st_mtime < int(modified): return False
+        known[rel] = {'version': _remote_version(item), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        adopted.append(rel)
+        return True
+
+    todo = [rel for rel, item in wanted.items() if not up_to_date(rel, item)]
+    report = {'remote_files': len(wanted), 'up_to_date': len(wanted) - len(todo), 'adopted': len(adopted), 'downloaded': 0,
+              'resumed': 0, 'bytes': 0, 'deleted': [], 'kept_modified': [], 'deletions_skipped': None}
+    if dry_run: report['pending'] = sorted(todo)
+
+    throttle = RateLimiter(bandwidth) if bandwidth else None
+
+    def fetch(rel):
+        item = wanted[rel]
+        dest = os.path.join(local_root, rel)
+        directory, name = os.path.split(dest)
+        part = os.path.join(directory, f".{name}.part")
+        os.makedirs(directory, exist_ok=True)
+        etag = item.get('etag')
+        with lock:
+            # El .part solo vale si se empezó con el mismo ETag
+            resume = etag if etag and partial.get(rel) == etag and os.path.exists(part) else None
+            if etag: partial[rel] = etag
+        received = remote.download(item['path'], part, if_range=resume, throttle=throttle)
+        if item.get('size') is not None and os.path.getsize(part) != item['size']:
+            os.remove(part)
+            with lock: partial.pop(rel, None)
+            raise StorageError(f"Tamaño inesperado en {rel}")
+        os.replace(part, dest)
+        st = os.stat(dest)
+        with lock:
+            partial.pop(rel, None)
+            known[rel] = {'version': _remote_version(item), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+        return received, resume is not None
+
+    if todo and not dry_run:
+        last_save = time.monotonic()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(fetch, rel): rel for rel in todo}
+                for future in concurrent.futures.as_completed(futures):
+                    try: received, resumed = future.result()
+                    except (StorageError, OSError) as e:
+                        errors.append({'file': futures[future], 'error': str(e)})
+                        continue
+                    report['downloaded'] += 1
+                    report['resumed'] += resumed
+                    report['bytes'] += received
+                    if time.monotonic() - last_save > 10:
+                        save_state()
+                        last_save = time.monotonic()
+        finally: save_state()
+    elif adopted and not dry_run: save_state()
+
+    gone = sorted(rel for rel in known if rel not in wanted)
+    if gone and delete:
+        if errors: report['deletions_skipped'] = "el recorrido o las descargas tuvieron errores"
+        elif len(gone) > max_delete * len(known):
+            report['deletions_skipped'] = f"{len(gone)} de {len(known)} ficheros superan el límite de borrado ({max_delete:.0%})"
+        else:
+            for rel in gone:
+                local, entry = os.path.join(local_root, rel), known[rel]
+                try: st = os.stat(local)
+                except FileNotFoundError: st = None
+                modified = st is not None and (st.st_size, st.st_mtime_ns) != (entry['size'], entry['mtime_ns'])
+                if modified: report['kept_modified'].append(rel)
+                elif st: report['deleted'].append(rel)
+                if dry_run: continue
+                if st and not modified:
+                    os.remove(local)
+                    # Se eliminan las carpetas que queden vacías, sin salir de LOCAL_PATH
+                    directory = os.path.dirname(local)
+                    while directory != local_root and directory.startswith(local_root):
+                        try: os.rmdir(directory)
+                        except OSError: break
+                        directory = os.path.dirname(directory)
+                known.pop(rel)
+            if not dry_run: save_state()
+
+    report['errors'] = errors
+    report['seconds'] = round(time.monotonic() - started, 2)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pymusic", description="Reproductor de música TUI para bibliotecas WebDAV.")
+    parser.add_argument('--config', default="pymusic.conf", help="Ruta del fichero de configuración")
+    parser.add_argument('--profile', nargs='?', const=PROFILE_DIR, metavar='DIR',
+                        help=f"Perfila todos los hilos y la memoria; escribe en DIR ({PROFILE_DIR} por defecto) al salir")
+    sub = parser.add_subparsers(dest='command')
+    check = sub.add_parser('check', help="Verifica las listas .m3u y emite un informe JSON")
+    check.add_argument('--fix', action='store_true', help="Reescribe las entradas con un único candidato por nombre")
+    check.add_argument('--no-crawl', action='store_true', help="No recorrer la biblioteca: verificar cada entrada con HEAD")
+    check.add_argument('--workers', type=int, default=16, help="Peticiones simultáneas (16 por defecto)")
+    check.add_argument('--output', help="Fichero donde escribir el informe (por defecto, salida estándar)")
+    dedup = sub.add_parser('dedup', help="Busca canciones duplicadas y emite un informe JSON")
+    dedup.add_argument('--workers', type=int, default=8, help="Descargas simultáneas (8 por defecto)")
+    dedup.add_argument('--processes', type=int, help="Procesos para calcular hashes (por defecto, uno por CPU)")
+    dedup.add_argument('--cache', help="Caché de hashes por ETag (por defecto, pymusic_dedup.json junto a la configuración)")
+    dedup.add_argument('--playlist', help="Guarda los duplicados en esta lista .m3u del usuario")
+    dedup.add_argument('--output', help="Fichero donde escribir el informe (por defecto, salida estándar)")
+    index = sub.add_parser('index', help="Genera el manifiesto de la biblioteca en la ruta MANIFEST del servidor")
+    index.add_argument('--workers', type=int, default=8, help="Peticiones PROPFIND simultáneas (8 por defecto)")
+    index.add_argument('--output', help="Fichero donde escribir el informe (por defecto, salida estándar)")
+    sync = sub.add_parser('sync', help="Copia o actualiza la biblioteca del servidor en LOCAL_PATH")
+    sync.add_argument('--workers', type=int, default=4, help="Descargas simultáneas (4 por defecto)")
+    sync.add_argument('--limit', type=int, help="Caudal máximo total en KiB/s")
+    sync.add_argument('--no-delete', action='store_true', help="No borra en local lo que ya no está en el servidor")
+    sync.add_argument('--max-delete', type=float, default=0.1, help="Fracción máxima de ficheros que se puede borrar (0.1 por defecto)")
+    sync.add_argument('--dry-run', action='store_true', help="Solo informa de lo que se descargaría o borraría")
+    sync.add_argument('--output', help="Fichero donde escribir el informe (por defecto, salida estándar)")
+    args = parser.parse_args(argv)
+    profiler = profiler_from_env(args.profile)
+    if profiler: profiler.start()
+    try: return _run_command(args, profiler)
+    finally:
+        if profiler:
+            for path in profiler.stop(): print(f"Perfil: {path}", file=sys.stderr)
+
+
+def _run_command(args, profiler=None):
+    def emit(report):
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f: f.write(text + "\n")
+        else: print(text)
+
+    if args.command == 'check':
+        config = ConfigManager(args.config)
+        report = check_playlists(WebDAVClient(config), config, crawl=not args.no_crawl, fix=args.fix, workers=max(1, args.workers))
+        emit(report)
+        return 1 if report['broken'] or report['unreachable'] else 0
+
+    if args.command == 'dedup':
+        config = ConfigManager(args.config)
+        client = WebDAVClient(config)
+        cache = args.cache or os.path.join(os.path.dirname(os.path.abspath(args.config)), 'pymusic_dedup.json')
+        report = find_duplicates(client, config, workers=max(1, args.workers), processes=args.processes, cache_path=cache)
+        if args.playlist and report['groups']:
+            report['playlist'] = save_duplicates_playlist(client, config, args.playlist, report['groups'])
+        emit(report)
+        return 0
+
+    if args.command == 'index':
+        config = ConfigManager(args.config)
+        client = WebDAVClient(config)
+        if not config.get('MANIFEST') or not hasattr(client.backend, 'save_bytes'):
+            print("❌ ERROR: 'index' necesita MANIFEST en 'pymusic.conf' y BACKEND = webdav con un único servidor")
+            return 1
+        report = build_manifest(client, config, workers=max(1, args.workers))
+        emit(report)
+        return 0 if report['saved'] else 1
+
+    if args.command == 'sync':
+        config = ConfigManager(args.config)
+        if not config.local_path:
+            print("❌ ERROR: 'sync' necesita LOCAL_PATH en 'pymusic.conf'")
+            return 1
+        report = sync_mirror(config, workers=max(1, args.workers), bandwidth=args.limit * 1024 if args.limit else None,
+                             delete=not args.no_delete, max_delete=args.max_delete, dry_run=args.dry_run)
+        emit(report)
+        return 1 if report['errors'] else 0
+
+    try: load_mpv()
+    except ImportError:
+        print("ERROR CRÍTICO: Instala python-mpv (pip install python-mpv).")
+        print("NOTA: Necesitas tener la librería libmpv instalada en tu sistema.")
+        return 1
+    except OSError:
+        print("ERROR CRÍTICO: No se encontró la librería compartida de MPV (libmpv).")
+        print("En Linux: sudo apt install libmpv1")
+        print("En Windows: Asegúrate de tener mpv-1.dll en el PATH o junto al script.")
+        return 1
+    CmusApp(args.config, profiler).run()
+    return 0
 
 if __name__ == "__main__":
-    app = CmusApp()
-    app.run()
+    sys.exit(main())
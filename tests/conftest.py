@@ -0,0 +1,148 @@
+import collections
+import email.utils
+import threading
+import time
+import urllib.parse
+import zlib
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def mpv_module():
+    """python-mpv cargado; salta la prueba si falta el módulo o libmpv."""
+    try: return pymusic.load_mpv()
+    except (ImportError, OSError): pytest.skip("python-mpv/libmpv no disponible")
+
+
+# --- BIBLIOTECA LOCAL ---
+@pytest.fixture
+def lib(tmp_path):
+    """Directorio de la biblioteca (LOCAL_PATH); cada prueba lo rellena."""
+    path = tmp_path / "lib"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def local_conf(tmp_path, lib):
+    """pymusic.conf con BACKEND = local: ROOT_PATH /musica/ sobre lib y las listas en /musica/listas/."""
+    path = tmp_path / "pymusic.conf"
+    path.write_text(f"[Servidor]\nROOT_PATH = /musica/\nPLAYLISTS_DIR = /musica/listas/\nLOCAL_PATH = {lib}\nBACKEND = local\n", encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def local_client(local_conf):
+    return pymusic.WebDAVClient(pymusic.ConfigManager(str(local_conf)))
+
+
+# --- SERVIDOR WEBDAV EN MEMORIA ---
+Sent = collections.namedtuple('Sent', 'method path headers timeout')
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.text = content.decode('utf-8', 'replace')
+        self.headers = headers or {}
+
+    def iter_content(self, size):
+        for i in range(0, len(self.content), size): yield self.content[i:i + size]
+
+    def close(self): pass
+
+
+class FakeDav:
+    """Servidor WebDAV en memoria que sustituye a requests.Session.
+
+    PROPFIND Depth 0/1 (getetag, getcontentlength, getlastmodified), GET con If-None-Match
+    y Range/If-Range, HEAD y PUT. files guarda el contenido por ruta decodificada y las
+    carpetas existen mientras tengan algún fichero. log anota cada petición; delay retrasa
+    los GET y skew desplaza el reloj del servidor.
+    """
+    def __init__(self):
+        self.files = {}
+        self.modified = {}
+        self.etags = {}
+        self.log = []
+        self.delay = 0
+        self.skew = 0
+        self.auth = None
+        self.lock = threading.Lock()
+
+    def now(self):
+        return time.time() + self.skew
+
+    def etag(self, path):
+        return self.etags.get(path) or f'"{zlib.crc32(self.files[path]):x}"'
+
+    def put_file(self, path, data, etag=None, modified=None):
+        """Como un PUT: un fichero nuevo cambia la fecha de su carpeta."""
+        with self.lock:
+            if path not in self.files: self.modified[path.rsplit('/', 1)[0] + '/'] = self.now()
+            self.files[path] = data
+            self.modified[path] = self.now() if modified is None else modified
+            if etag: self.etags[path] = etag
+            else: self.etags.pop(path, None)
+
+    def sent(self, method):
+        return [r for r in self.log if r.method == method]
+
+    def _respond(self, status_code, content=b"", path=None):
+        headers = {'Date': email.utils.formatdate(self.now(), usegmt=True)}
+        if path in self.files: headers['ETag'] = self.etag(path)
+        return FakeResponse(status_code, content, headers)
+
+    def _prop(self, href, path):
+        stamp = email.utils.formatdate(self.modified.get(path, 1_000_000), usegmt=True)
+        if path.endswith('/'): props = "<d:resourcetype><d:collection/></d:resourcetype>"
+        else:
+            props = (f"<d:resourcetype/><d:getetag>{self.etag(path)}</d:getetag>"
+                     f"<d:getcontentlength>{len(self.files[path])}</d:getcontentlength>")
+        return (f"<d:response><d:href>{urllib.parse.quote(href)}</d:href><d:propstat><d:prop>{props}"
+                f"<d:getlastmodified>{stamp}</d:getlastmodified></d:prop></d:propstat></d:response>")
+
+    def request(self, method, url, headers=None, timeout=None, data=None, **kwargs):
+        path = urllib.parse.unquote(urllib.parse.urlparse(url).path)
+        headers = dict(headers or {})
+        with self.lock: self.log.append(Sent(method, path, headers, timeout))
+        if method == 'PUT':
+            self.put_file(path, data.encode('utf-8') if isinstance(data, str) else data)
+            return self._respond(201, path=path)
+        if method == 'PROPFIND':
+            base = path.rstrip('/') + '/'
+            with self.lock:
+                children = set()
+                for p in self.files:
+                    if not p.startswith(base): continue
+                    name, sep, _ = p[len(base):].partition('/')
+                    children.add(name + ('/' if sep else ''))
+                if not children: return self._respond(404)
+                body = self._prop(base, base)
+                if headers.get('Depth') == '1': body += "".join(self._prop(base + c, base + c) for c in sorted(children))
+            return self._respond(207, f'<d:multistatus xmlns:d="DAV:">{body}</d:multistatus>'.encode())
+        with self.lock:
+            data = self.files.get(path)
+            found = data is not None or any(p.startswith(path.rstrip('/') + '/') for p in self.files)
+        if method == 'HEAD': return self._respond(200 if found else 404, path=path)
+        if self.delay: time.sleep(self.delay)
+        if data is None: return self._respond(404)
+        if headers.get('If-None-Match') == self.etag(path): return self._respond(304, path=path)
+        if 'Range' in headers and headers.get('If-Range') == self.etag(path):
+            return self._respond(206, data[int(headers['Range'][6:].rstrip('-')):], path)
+        return self._respond(200, data, path)
+
+    def get(self, url, **kwargs): return self.request('GET', url, **kwargs)
+    def put(self, url, **kwargs): return self.request('PUT', url, **kwargs)
+
+
+@pytest.fixture
+def dav(monkeypatch):
+    """FakeDav instalado como requests.Session para los WebDAVBackend que se creen en la prueba."""
+    server = FakeDav()
+    monkeypatch.setattr(pymusic.requests, 'Session', lambda: server)
+    return server
@@ -0,0 +1,28 @@
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def player(mpv_module):
+    p = pymusic.AudioPlayer()
+    yield p
+    p.close()
+
+
+def test_stalls_and_underruns_are_counted_on_rising_edges(player):
+    for value in (True, True, False, True, False):
+        player._on_paused_for_cache('paused-for-cache', value)
+    for value in ({'underrun': True}, {'underrun': True}, {'underrun': False}, None):
+        player._on_cache_state('demuxer-cache-state', value)
+    assert player.stalls == 2
+    assert player.underruns == 1
+    assert "Cortes:2" in player.buffer_summary()
+
+
+def test_auto_profile_follows_throughput_and_stalls(player):
+    assert player.buffer_profile == 'wan'
+    player._on_cache_speed('cache-speed', 50 * 1024 * 1024)
+    assert player._choose_profile() == 'lan'
+    player._on_paused_for_cache('paused-for-cache', True)
+    assert player._choose_profile() == 'wan'
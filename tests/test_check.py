@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def conf(lib, local_conf):
+    (lib / "Artista" / "Disco (2001)").mkdir(parents=True)
+    (lib / "Artista" / "Disco (2001)" / "01 Intro.mp3").write_bytes(b"x")
+    (lib / "Artista" / "Disco (2001)" / "02 Fin.mp3").write_bytes(b"x")
+    (lib / "listas").mkdir()
+    (lib / "listas" / "mix.m3u").write_text(
+        "#EXTM3U\nArtista/Disco (2001)/01 Intro.mp3\n/musica/Artista/Disco/02 Fin.mp3\n/musica/Otro/03 Nada.mp3\n", encoding='utf-8')
+    return local_conf
+
+
+def test_report_lists_broken_entries_with_suggestions(conf):
+    config = pymusic.ConfigManager(str(conf))
+    report = pymusic.check_playlists(pymusic.WebDAVClient(config), config)
+    assert report['playlists'] == 1 and report['entries'] == 3
+    assert [(b['line'], b['suggestion']) for b in report['broken']] == [
+        (3, '/musica/Artista/Disco (2001)/02 Fin.mp3'),
+        (4, None),
+    ]
+
+
+def test_cli_fix_rewrites_fixable_entries(conf, lib, capsys):
+    assert pymusic.main(['--config', str(conf), 'check', '--fix']) == 1
+    report = json.loads(capsys.readouterr().out)
+    assert report['fixed'] == 1
+    text = (lib / "listas" / "mix.m3u").read_text(encoding='utf-8')
+    assert "/musica/Artista/Disco (2001)/02 Fin.mp3" in text
+    assert "/musica/Otro/03 Nada.mp3" in text
+
+
+def test_no_crawl_mode_probes_each_entry(conf):
+    config = pymusic.ConfigManager(str(conf))
+    report = pymusic.check_playlists(pymusic.WebDAVClient(config), config, crawl=False)
+    assert len(report['broken']) == 2
+    assert all(b['suggestion'] is None for b in report['broken'])
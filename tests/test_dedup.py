@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def conf(lib, local_conf):
+    big = bytes(range(256)) * 1024
+    (lib / "A").mkdir(parents=True)
+    (lib / "B").mkdir()
+    (lib / "listas").mkdir()
+    (lib / "A" / "01 Tema.mp3").write_bytes(big)
+    (lib / "B" / "01 Tema (copia).mp3").write_bytes(big)
+    # Mismo tamaño, distinto contenido en la parte central
+    (lib / "B" / "02 Otro.mp3").write_bytes(big[:len(big) // 2] + b"\0" * (len(big) // 2))
+    (lib / "B" / "notas.txt").write_bytes(big)
+    return local_conf
+
+
+def test_groups_identical_audio_only(conf, tmp_path):
+    config = pymusic.ConfigManager(str(conf))
+    report = pymusic.find_duplicates(pymusic.WebDAVClient(config), config, processes=1, cache_path=str(tmp_path / "cache.json"))
+    assert report['candidates'] == 3 and report['hashed'] == 3
+    assert [g['files'] for g in report['groups']] == [['/musica/A/01 Tema.mp3', '/musica/B/01 Tema (copia).mp3']]
+    assert report['wasted_bytes'] == 256 * 1024
+
+
+def test_cache_skips_unchanged_files(conf, tmp_path):
+    config = pymusic.ConfigManager(str(conf))
+    cache = str(tmp_path / "cache.json")
+    pymusic.find_duplicates(pymusic.WebDAVClient(config), config, processes=1, cache_path=cache)
+    assert len(json.load(open(cache))) == 3
+    report = pymusic.find_duplicates(pymusic.WebDAVClient(config), config, processes=1, cache_path=cache)
+    assert report['hashed'] == 0 and len(report['groups']) == 1
+
+
+def test_cli_writes_playlist(conf, lib, tmp_path, capsys):
+    cache = str(tmp_path / "cache.json")
+    assert pymusic.main(['--config', str(conf), 'dedup', '--processes', '1', '--cache', cache, '--playlist', 'duplicados']) == 0
+    report = json.loads(capsys.readouterr().out)
+    assert report['playlist'] == '/musica/listas/duplicados.m3u'
+    text = (lib / "listas" / "duplicados.m3u").read_text(encoding='utf-8')
+    assert text.splitlines()[1].startswith("# Duplicados 1: 2 copias")
+    assert "/musica/B/01 Tema (copia).mp3" in text
+
+
+def test_read_errors_name_the_file(conf, tmp_path, monkeypatch):
+    config = pymusic.ConfigManager(str(conf))
+    client = pymusic.WebDAVClient(config)
+    read_range = client.backend.read_range
+    def failing(path, start, length):
+        if 'Otro' in path: raise pymusic.StorageError("sin acceso")
+        return read_range(path, start, length)
+    monkeypatch.setattr(client.backend, 'read_range', failing)
+    report = pymusic.find_duplicates(client, config, processes=1)
+    assert report['errors'] == [{'file': '/musica/B/02 Otro.mp3', 'error': "sin acceso"}]
+    assert len(report['groups']) == 1
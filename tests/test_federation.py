@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+import pymusic
+
+
+class FakeBackend(pymusic.StorageBackend):
+    def __init__(self, tree, delay=0.0, host="nas"):
+        self.tree = tree
+        self.delay = delay
+        self.host = host
+        self.saved = {}
+
+    def list_directory(self, path):
+        time.sleep(self.delay)
+        key = '/' + path.strip('/')
+        if key not in self.tree: raise pymusic.StorageError("404")
+        return pymusic.sort_items([{'name': n, 'path': f"{key.rstrip('/')}/{n}", 'is_dir': d} for n, d in self.tree[key]])
+
+    def read_file(self, path):
+        time.sleep(self.delay)
+        return self.saved.get(path, "")
+
+    def save_file(self, path, content):
+        self.saved[path] = content
+        return True
+
+    def stream_url(self, path):
+        return f"http://{self.host}{path}"
+
+
+def federation(slow_delay=0.0, slow_timeout=5.0):
+    main = FakeBackend({'/musica': [('Rock', True), ('a.mp3', False)]}, host="principal")
+    backup = FakeBackend({'/copia/musica': [('Jazz', True), ('a.mp3', False)]}, delay=slow_delay, host="copia")
+    return pymusic.FederatedBackend([
+        pymusic._Source('principal', main, '/musica/', 5.0),
+        pymusic._Source('copia', backup, '/copia/musica/', slow_timeout),
+    ])
+
+
+def test_listings_are_merged_into_one_virtual_tree():
+    fed = federation()
+    items = fed.list_directory('/musica/')
+    assert [(i['name'], i['path']) for i in items] == [('Jazz', '/musica/Jazz'), ('Rock', '/musica/Rock'), ('a.mp3', '/musica/a.mp3')]
+
+
+def test_slow_source_is_dropped_after_its_timeout():
+    fed = federation(slow_delay=1.0, slow_timeout=0.2)
+    started = time.monotonic()
+    names = [i['name'] for i in fed.list_directory('/musica/')]
+    assert time.monotonic() - started < 0.8
+    assert names == ['Rock', 'a.mp3']
+    assert "copia: caída" in fed.latency_summary()
+
+
+def test_stream_uses_fastest_replica_and_writes_go_to_primary():
+    fed = federation(slow_delay=0.05)
+    fed.list_directory('/musica/')
+    fed.sources[0].latency, fed.sources[1].latency = 0.5, 0.01
+    assert fed.stream_url('/musica/a.mp3') == "http://copia/copia/musica/a.mp3"
+    assert fed.stream_url('/musica/Rock') == "http://copia/copia/musica/Rock"
+    assert fed.save_file('/musica/listas/x.m3u', "#EXTM3U")
+    assert fed.primary.backend.saved == {'/musica/listas/x.m3u': "#EXTM3U"}
@@ -0,0 +1,90 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+import pymusic
+
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '100000')
+        self.end_headers()
+        try:
+            for _ in range(100):
+                self.wfile.write(b'x' * 1000)
+                self.wfile.flush()
+                time.sleep(0.1)
+        except OSError: pass
+
+    def log_message(self, *args): pass
+
+
+@pytest.fixture
+def slow_client(tmp_path):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conf = tmp_path / "pymusic.conf"
+    conf.write_text(f"[Servidor]\nWEBDAV_SERVER = http://127.0.0.1:{server.server_port}/\nROOT_PATH = /\n", encoding='utf-8')
+    yield pymusic.WebDAVClient(pymusic.ConfigManager(str(conf)))
+    server.shutdown()
+
+
+def test_superseded_load_is_cancelled_and_aborts_http(slow_client):
+    loader = pymusic.BackgroundLoader(2)
+    events = []
+    done = threading.Event()
+    def slow(token):
+        started = time.monotonic()
+        try: slow_client.read_file('/lista.m3u')
+        except pymusic.LoadCancelled:
+            events.append(('cancelled', time.monotonic() - started))
+            raise
+        finally: done.set()
+    first = loader.submit('playlist', slow)
+    time.sleep(0.3)
+    second = loader.submit('playlist', lambda token: events.append('second'))
+    assert done.wait(3)
+    assert first.cancelled and not second.cancelled
+    assert events[0] == 'second' or events[0][0] == 'cancelled'
+    assert [e for e in events if e != 'second'][0][1] < 2
+    assert second.generation == first.generation + 1
+    loader.shutdown()
+
+
+def test_independent_tasks_are_never_superseded_and_threads_are_bounded():
+    loader = pymusic.BackgroundLoader(3)
+    running, peak, lock = [0], [0], threading.Lock()
+    finished = threading.Semaphore(0)
+    def task(token):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock: running[0] -= 1
+        finished.release()
+    tokens = [loader.submit(None, task) for _ in range(12)]
+    for _ in tokens: assert finished.acquire(timeout=3)
+    assert peak[0] <= 3
+    assert not any(t.cancelled for t in tokens)
+    loader.shutdown()
+
+
+def test_followers_retry_when_leading_load_is_cancelled():
+    client = pymusic.WebDAVClient.__new__(pymusic.WebDAVClient)
+    client._inflight, client._inflight_lock = {}, threading.Lock()
+    client.coalesce_hits = client.coalesce_misses = 0
+    calls = []
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        if len(calls) == 1: raise pymusic.LoadCancelled()
+        return "ok"
+    leader = threading.Thread(target=lambda: pytest.raises(pymusic.LoadCancelled, client._single_flight, 'k', fetch))
+    leader.start()
+    time.sleep(0.02)
+    assert client._single_flight('k', fetch) == "ok"
+    leader.join()
+    assert len(calls) == 2
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def backend(lib, local_conf):
+    (lib / "Artista" / "Disco").mkdir(parents=True)
+    (lib / "Artista" / "Disco" / "01 Intro.mp3").write_bytes(b"x")
+    (lib / ".oculto").write_text("")
+    return pymusic.LocalBackend(pymusic.ConfigManager(str(local_conf)))
+
+
+def test_list_directory_maps_root_path(backend):
+    assert backend.list_directory('/musica/') == [{'name': 'Artista', 'path': '/musica/Artista/', 'is_dir': True}]
+    items = backend.list_directory('/musica/Artista/Disco/')
+    assert [(i['name'], i['path'], i['is_dir'], i['size']) for i in items] == [('01 Intro.mp3', '/musica/Artista/Disco/01%20Intro.mp3', False, 1)]
+    assert items[0]['etag']
+    assert backend.stream_url(items[0]['path']).endswith("lib/Artista/Disco/01 Intro.mp3")
+
+
+def test_paths_outside_root_are_rejected(backend):
+    with pytest.raises(pymusic.StorageError):
+        backend.list_directory('/otra/')
+
+
+def test_save_file_is_atomic_and_invalidates_listing(backend):
+    assert backend.save_file('/musica/listas/nueva.m3u', "#EXTM3U\n")
+    assert backend.read_file('/musica/listas/nueva.m3u') == "#EXTM3U\n"
+    assert [i['name'] for i in backend.list_directory('/musica/listas/')] == ['nueva.m3u']
+    assert backend.read_file('/musica/listas/falta.m3u') == ""
+
+
+def test_external_change_invalidates_cache(backend):
+    backend.list_directory('/musica/Artista/Disco/')
+    with open(backend.to_local('/musica/Artista/Disco/02 Fin.mp3'), 'wb') as f: f.write(b"x")
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        names = [i['name'] for i in backend.list_directory('/musica/Artista/Disco/')]
+        if len(names) == 2: break
+        time.sleep(0.05)
+    assert names == ['01 Intro.mp3', '02 Fin.mp3']
+
+
+@pytest.mark.parametrize('inotify', [True, False])
+def test_in_place_append_updates_size_and_etag(backend, inotify):
+    if not inotify: backend._inotify = None
+    path = backend.to_local('/musica/Artista/Disco/01 Intro.mp3')
+    before = backend.list_directory('/musica/Artista/Disco/')[0]
+    time.sleep(0.01)
+    with open(path, 'ab') as f: f.write(b"yz")
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        item = backend.list_directory('/musica/Artista/Disco/')[0]
+        if item['size'] == 3: break
+        time.sleep(0.05)
+    assert item['size'] == 3
+    assert item['etag'] != before['etag']
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def dav(dav):
+    for path in ('/musica/A/01 Uno.mp3', '/musica/A/02.mp3', '/musica/B/C/03.mp3'):
+        dav.files[path] = b"x" * 10
+    return dav
+
+
+def make_client(tmp_path, ttl=300):
+    conf = tmp_path / "pymusic.conf"
+    conf.write_text("[Servidor]\nWEBDAV_SERVER = http://nas/musica/\nROOT_PATH = /musica/\n"
+                    f"MANIFEST = /musica/.pymusic_manifest.json.gz\nMANIFEST_TTL = {ttl}\n", encoding='utf-8')
+    config = pymusic.ConfigManager(str(conf))
+    return pymusic.WebDAVClient(config), config
+
+
+def test_browsing_from_the_manifest_costs_one_get_and_one_propfind(dav, tmp_path):
+    client, config = make_client(tmp_path)
+    report = pymusic.build_manifest(client, config)
+    assert report['saved'] and report['dirs'] == 4 and report['files'] == 3
+    live = client.backend.live.list_directory('/musica/A/')
+    dav.log.clear()
+    # La raíz se lista en vivo al revalidar el manifiesto; el resto sale de él
+    assert [i['name'] for i in client.backend.list_directory('/musica/')] == ['A', 'B']
+    assert client.backend.list_directory('/musica/A/') == [{k: i[k] for k in ('name', 'path', 'is_dir', 'size', 'etag')} for i in live]
+    for path in ('/musica/B/', '/musica/B/C/', '/musica/A/', '/musica/B/'):
+        client.backend.list_directory(path)
+    assert [(r.method, r.headers.get('Depth')) for r in dav.log] == [('GET', None), ('PROPFIND', '1')]
+    assert client.backend.manifest_hits == 5
+
+
+def test_unchanged_manifest_costs_a_304(dav, tmp_path):
+    client, config = make_client(tmp_path, ttl=0)
+    pymusic.build_manifest(client, config)
+    client.backend.list_directory('/musica/A/')
+    etag = client.backend._etag
+    client.backend.list_directory('/musica/A/')
+    assert client.backend._etag == etag and len(dav.sent('GET')) == 2
+
+
+def test_newer_and_unknown_folders_are_listed_live(dav, tmp_path):
+    client, config = make_client(tmp_path)
+    pymusic.build_manifest(client, config)
+    dav.log.clear()
+    dav.put_file('/musica/A/03 Nuevo.mp3', b"y")
+    dav.put_file('/musica/D/04.mp3', b"z")
+    assert '03 Nuevo.mp3' in [i['name'] for i in client.backend.list_directory('/musica/A/')]
+    assert [i['name'] for i in client.backend.list_directory('/musica/D/')] == ['04.mp3']
+    assert client.backend.list_directory('/musica/B/')
+    # Raíz al revalidar, A (fecha distinta) y D (no está en el manifiesto)
+    assert client.backend.live_lists == 3 and client.backend.manifest_hits == 1
+    assert len(dav.sent('PROPFIND')) == 3
+
+
+def test_changes_show_up_after_the_ttl_and_clear_with_a_new_manifest(dav, tmp_path):
+    client, config = make_client(tmp_path)
+    pymusic.build_manifest(client, config)
+    client.backend.list_directory('/musica/A/')
+    dav.put_file('/musica/A/03 Nuevo.mp3', b"y")
+    # Dentro del TTL se confía en el manifiesto
+    assert '03 Nuevo.mp3' not in [i['name'] for i in client.backend.list_directory('/musica/A/')]
+    client.backend._checked = None
+    assert '03 Nuevo.mp3' in [i['name'] for i in client.backend.list_directory('/musica/A/')]
+    pymusic.build_manifest(client, config)
+    client.backend._checked = None
+    hits = client.backend.manifest_hits
+    assert '03 Nuevo.mp3' in [i['name'] for i in client.backend.list_directory('/musica/A/')]
+    assert client.backend.manifest_hits == hits + 1
+
+
+def test_generated_uses_the_server_clock(dav, tmp_path):
+    dav.skew = -3600
+    client, config = make_client(tmp_path)
+    pymusic.build_manifest(client, config)
+    manifest = json.loads(gzip.decompress(dav.files['/musica/.pymusic_manifest.json.gz']))
+    assert abs(manifest['generated'] - dav.now()) < 5
+    # Carpeta sin fecha guardada y modificada tras generar el manifiesto, con el reloj local una hora por delante
+    manifest['dirs']['/musica/'] = [e[:4] + [None] for e in manifest['dirs']['/musica/']]
+    dav.files['/musica/.pymusic_manifest.json.gz'] = gzip.compress(json.dumps(manifest).encode())
+    dav.put_file('/musica/A/03 Nuevo.mp3', b"y")
+    assert '03 Nuevo.mp3' in [i['name'] for i in client.backend.list_directory('/musica/A/')]
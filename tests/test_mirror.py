@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def env(tmp_path, dav):
+    dav.put_file('/musica/A/01.mp3', b"a" * 1000, '"a1"')
+    dav.put_file('/musica/A/02.mp3', b"b" * 1000, '"b1"')
+    dav.put_file('/musica/B/03.mp3', b"c" * 1000, '"c1"')
+    conf = tmp_path / "pymusic.conf"
+    conf.write_text(f"[Servidor]\nWEBDAV_SERVER = http://nas/musica/\nROOT_PATH = /musica/\nLOCAL_PATH = {tmp_path / 'espejo'}\n", encoding='utf-8')
+    return dav, pymusic.ConfigManager(str(conf)), tmp_path / 'espejo'
+
+
+def fetched(dav):
+    return sorted(r.path for r in dav.sent('GET'))
+
+
+def test_second_sync_only_fetches_changes(env):
+    dav, config, mirror = env
+    report = pymusic.sync_mirror(config)
+    assert report['downloaded'] == 3 and report['bytes'] == 3000
+    assert (mirror / "B" / "03.mp3").read_bytes() == b"c" * 1000
+    dav.log.clear()
+    assert pymusic.sync_mirror(config)['up_to_date'] == 3 and dav.sent('GET') == []
+    dav.put_file('/musica/A/02.mp3', b"B" * 500, '"b2"')
+    report = pymusic.sync_mirror(config)
+    assert report['downloaded'] == 1 and fetched(dav) == ['/musica/A/02.mp3']
+    assert (mirror / "A" / "02.mp3").read_bytes() == b"B" * 500
+
+
+def test_interrupted_download_resumes(env):
+    dav, config, mirror = env
+    (mirror / "A").mkdir(parents=True)
+    (mirror / "A" / ".01.mp3.part").write_bytes(b"a" * 400)
+    (mirror / pymusic.SYNC_STATE).write_text(json.dumps({'partial': {'A/01.mp3': '"a1"'}}), encoding='utf-8')
+    report = pymusic.sync_mirror(config)
+    assert report['resumed'] == 1 and report['bytes'] == 2600
+    assert (mirror / "A" / "01.mp3").read_bytes() == b"a" * 1000
+    assert not (mirror / "A" / ".01.mp3.part").exists()
+
+
+def test_deletions_are_guarded(env):
+    dav, config, mirror = env
+    pymusic.sync_mirror(config)
+    (mirror / "propio.mp3").write_bytes(b"mio")
+    del dav.files['/musica/B/03.mp3']
+    assert pymusic.sync_mirror(config, max_delete=0.1)['deletions_skipped']
+    report = pymusic.sync_mirror(config, max_delete=0.5)
+    assert report['deleted'] == ['B/03.mp3']
+    assert not (mirror / "B").exists() and (mirror / "propio.mp3").exists()
+
+
+def test_locally_modified_files_are_kept(env):
+    dav, config, mirror = env
+    pymusic.sync_mirror(config)
+    (mirror / "A" / "01.mp3").write_bytes(b"editado")
+    del dav.files['/musica/A/01.mp3']
+    report = pymusic.sync_mirror(config, max_delete=1)
+    assert report['kept_modified'] == ['A/01.mp3'] and report['deleted'] == []
+    assert (mirror / "A" / "01.mp3").read_bytes() == b"editado"
+
+
+def test_rate_limiter_caps_throughput():
+    limit = pymusic.RateLimiter(100_000)
+    started = time.monotonic()
+    for _ in range(5): limit(40_000)
+    assert time.monotonic() - started >= 0.9
+
+
+def test_hand_copied_files_are_adopted(env):
+    dav, config, mirror = env
+    dav.put_file('/musica/A/01.mp3', b"a" * 1000, '"a1"', time.time() - 3600)
+    dav.put_file('/musica/A/02.mp3', b"b" * 1000, '"b1"', time.time() - 3600)
+    (mirror / "A").mkdir(parents=True)
+    (mirror / "A" / "01.mp3").write_bytes(b"a" * 1000)
+    # Mismo tamaño pero más antiguo que la versión del servidor: se descarga
+    (mirror / "A" / "02.mp3").write_bytes(b"x" * 1000)
+    os.utime(mirror / "A" / "02.mp3", (time.time() - 7200,) * 2)
+    report = pymusic.sync_mirror(config)
+    assert report['adopted'] == 1 and report['downloaded'] == 2
+    assert fetched(dav) == ['/musica/A/02.mp3', '/musica/B/03.mp3']
+    assert (mirror / "A" / "02.mp3").read_bytes() == b"b" * 1000
+    dav.log.clear()
+    assert pymusic.sync_mirror(config)['up_to_date'] == 3 and dav.sent('GET') == []
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def client(lib, local_client):
+    (lib / "listas").mkdir(parents=True)
+    (lib / "listas" / "rock.m3u").write_text("#EXTM3U\nA/01.mp3\n/musica/B/02.mp3\n", encoding='utf-8')
+    (lib / "listas" / "chill.m3u").write_text("#EXTM3U\n/musica/A/01.mp3\n", encoding='utf-8')
+    (lib / "raiz.m3u").write_text("#EXTM3U\n/musica/B/02.mp3\n", encoding='utf-8')
+    return local_client
+
+
+@pytest.fixture
+def index(client):
+    idx = pymusic.PlaylistIndex(client, ['/musica/listas/', '/musica/'])
+    idx.refresh()
+    return idx
+
+
+def names(paths):
+    return sorted(p.split('/')[-1] for p in paths)
+
+
+def test_lookup_resolves_relative_and_absolute_entries(index):
+    assert names(index.playlists_for('/musica/A/01.mp3')) == ['chill.m3u', 'rock.m3u']
+    assert names(index.playlists_for('http://nas/musica/B/02.mp3')) == ['raiz.m3u', 'rock.m3u']
+    assert index.playlists_for('/musica/C/03.mp3') == []
+
+
+def test_store_writes_update_index_incrementally(client, index):
+    client.append_to_m3u('/musica/listas/chill.m3u', '/musica/C/03.mp3')
+    assert names(index.playlists_for('/musica/C/03.mp3')) == ['chill.m3u']
+
+
+def test_remove_everywhere_and_deleted_playlists(client, index, lib):
+    assert index.remove_everywhere('/musica/A/01.mp3') == 2
+    assert index.playlists_for('/musica/A/01.mp3') == []
+    assert "A/01.mp3" not in (lib / "listas" / "rock.m3u").read_text(encoding='utf-8')
+    (lib / "raiz.m3u").unlink()
+    # El evento de inotify llega de forma asíncrona
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        index.refresh()
+        if names(index.playlists_for('/musica/B/02.mp3')) == ['rock.m3u']: break
+        time.sleep(0.05)
+    assert names(index.playlists_for('/musica/B/02.mp3')) == ['rock.m3u']
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from textual.widgets import DataTable
+
+import pymusic
+
+
+class SmallBlocks(pymusic.PlaylistSearch):
+    BLOCK = 3
+
+
+def tracks(*names):
+    return [pymusic.Track(f"/musica/Disco/{n}.mp3", n, "Disco") for n in names]
+
+
+def index(*names):
+    return SmallBlocks(pymusic.search_keys(tracks(*names)))
+
+
+def test_fold_ignores_case_and_accents():
+    assert pymusic.fold_text("Canción ÁRBOL Ñu") == "cancion arbol nu"
+    search = index("Canción", "otra", "CANCION triste")
+    assert search.find("cancion") == 0
+    assert search.find("CANCIÓN", 1) == 2
+
+
+def test_find_wraps_and_reverses_across_blocks():
+    search = index("a1", "b", "a2", "c", "d", "a3", "e")
+    assert search.find("a", 3) == 5
+    assert search.find("a", 6) == 0
+    assert search.find("a", 5, reverse=True) == 2
+    assert search.find("a", 0, reverse=True) == 5
+    assert search.find("zz") is None
+    assert search.count("a") == 3
+
+
+def test_incremental_extend_and_remove():
+    search = index("uno", "dos")
+    search.extend(pymusic.search_keys(tracks("tres", "cuatro", "cinco")))
+    assert len(search) == 5 and search.find("cinco") == 4
+    search.remove(0)
+    search.remove(1)
+    assert len(search) == 3
+    assert [search.find(q) for q in ("dos", "cuatro", "cinco", "tres")] == [0, 1, 2, None]
+
+
+def test_match_does_not_span_rows():
+    search = index("abc", "def")
+    assert search.find("cd") is None and search.find("c d") is None
+
+
+def test_type_to_jump_in_the_right_pane(lib, local_conf, mpv_module):
+    disco = lib / "Disco"
+    disco.mkdir()
+    for name in ("01 Intro", "02 Canción", "03 Final", "04 Otra canción"):
+        (disco / f"{name}.mp3").write_bytes(b"x")
+
+    async def main():
+        app = pymusic.CmusApp(str(local_conf))
+        async with app.run_test() as pilot:
+            app.add_tracks_recursive('/musica/Disco/', True)
+            for _ in range(50):
+                if len(app.active_playlist) == 4: break
+                await pilot.pause(0.1)
+            table = app.query_one(DataTable)
+            table.focus()
+            await pilot.press("/", "c", "a", "n")
+            assert table.cursor_row == 1
+            await pilot.press("enter", "n")
+            assert table.cursor_row == 3
+            await pilot.press("n")
+            assert table.cursor_row == 1
+            app.action_remove_from_playlist()
+            app.search_query = "final"
+            app.action_search_next()
+            assert table.cursor_row == 1 and app.active_playlist[1].name == "03 Final.mp3"
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+import threading
+import time
+
+import pytest
+
+import pymusic
+
+
+def busy_parse(stop):
+    while not stop.is_set(): sum(i * i for i in range(1000))
+
+
+def test_samples_worker_threads_and_memory(tmp_path):
+    profiler = pymusic.SamplingProfiler(str(tmp_path), interval=0.001).start()
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_parse, args=(stop,), name="webdav-worker")
+    worker.start()
+    time.sleep(0.3)
+    first = profiler.write()
+    stop.set()
+    worker.join()
+    paths = profiler.stop()
+    collapsed = open(first[0], encoding='utf-8').read().splitlines()
+    assert any(line.startswith("webdav-worker;") and "busy_parse (test_profiler.py:" in line for line in collapsed)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in collapsed)
+    assert "# Crecimiento desde el volcado anterior" in open(paths[1], encoding='utf-8').read()
+
+
+def test_enabled_by_env(monkeypatch, tmp_path):
+    monkeypatch.delenv('PYMUSIC_PROFILE', raising=False)
+    assert pymusic.profiler_from_env() is None
+    monkeypatch.setenv('PYMUSIC_PROFILE', str(tmp_path))
+    assert pymusic.profiler_from_env().directory == str(tmp_path)
+    monkeypatch.setenv('PYMUSIC_PROFILE', '1')
+    assert pymusic.profiler_from_env().directory == pymusic.PROFILE_DIR
@@ -0,0 +1,22 @@
+import pytest
+
+from pymusic import Track
+
+
+def test_from_path_splits_name_and_album():
+    t = Track.from_path("/musica/Artista/%C3%81lbum/01%20Intro.mp3")
+    assert t.path == "/musica/Artista/%C3%81lbum/01%20Intro.mp3"
+    assert t.name == "01 Intro.mp3"
+    assert t.album == "Álbum"
+
+
+def test_tracks_of_same_album_share_strings():
+    a = Track("/musica/X/Disco/01.mp3", "01.mp3", "Disco")
+    b = Track("/musica/X/" + "Disco/02.mp3", "02.mp3", "Dis" + "co")
+    assert a._dir is b._dir
+    assert a.album is b.album
+    assert a.name is a._base
+
+
+def test_track_has_no_instance_dict():
+    assert not hasattr(Track.from_path("/a/b.mp3"), '__dict__')
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from textual.widgets import Tree
+
+import pymusic
+
+
+@pytest.fixture
+def conf(lib, local_conf, mpv_module):
+    for i in range(pymusic.TREE_GROUP_THRESHOLD + 10):
+        (lib / f"{'AB1'[i % 3]}rtista {i:05d}").mkdir(parents=True)
+    for i in range(pymusic.TREE_PAGE_SIZE + 5):
+        (lib / "Ana" / f"Disco {i:03d}").mkdir(parents=True)
+    return local_conf
+
+
+def run(conf, scenario):
+    async def main():
+        app = pymusic.CmusApp(str(conf))
+        async with app.run_test() as pilot:
+            tree = app.query_one(Tree)
+            for _ in range(50):
+                if tree.root.children: break
+                await pilot.pause(0.1)
+            await scenario(app, pilot, tree)
+    asyncio.run(main())
+
+
+def test_huge_folder_is_grouped_and_paginated(conf):
+    async def scenario(app, pilot, tree):
+        assert [str(c.label).split(' (')[0] for c in tree.root.children] == ['🔤 A', '🔤 B', '🔤 #']
+        bucket = tree.root.children[0]
+        bucket.expand()
+        await pilot.pause(0.1)
+        assert len(bucket.children) == pymusic.TREE_PAGE_SIZE + 1
+        app.expand_more_node(bucket.children[-1])
+        assert bucket.children[-1].data['type'] == 'dir'
+    run(conf, scenario)
+
+
+def test_filtered_folder_loads_children_in_pages(conf):
+    async def scenario(app, pilot, tree):
+        app.filter_tree("ana")
+        node = tree.root.children[0]
+        node.expand()
+        for _ in range(50):
+            if node.children: break
+            await pilot.pause(0.1)
+        assert len(node.children) == pymusic.TREE_PAGE_SIZE + 1
+        assert str(node.children[-1].label) == "… 5 más"
+    run(conf, scenario)
@@ -0,0 +1,94 @@
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+import pymusic
+
+
+@pytest.fixture
+def client(tmp_path, dav):
+    dav.delay = 0.2
+    conf = tmp_path / "pymusic.conf"
+    conf.write_text("[Servidor]\nWEBDAV_SERVER = http://nas/musica/\nROOT_PATH = /musica/\nPLAYLISTS_DIR = /musica/listas/\n", encoding='utf-8')
+    return pymusic.WebDAVClient(pymusic.ConfigManager(str(conf)))
+
+
+def server_path(client, path):
+    return urllib.parse.unquote(urllib.parse.urlparse(client.backend.get_full_url(path)).path)
+
+
+def run_parallel(n, fn):
+    results = [None] * n
+    def target(i): results[i] = fn()
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return results
+
+
+def test_simultaneous_reads_share_one_get(client, dav):
+    dav.files['/musica/a.m3u'] = "#EXTM3U\n/musica/x.mp3".encode()
+    results = run_parallel(8, lambda: client.read_file('/musica/a.m3u'))
+    assert len(dav.sent('GET')) == 1
+    assert client.coalesce_hits == 7
+    assert client.coalesce_misses == 1
+    assert all(r == "#EXTM3U\n/musica/x.mp3" for r in results)
+
+
+def test_write_invalidates_inflight_read(client, dav):
+    dav.files['/musica/a.m3u'] = b"viejo"
+    reader = threading.Thread(target=client.read_file, args=('/musica/a.m3u',))
+    reader.start()
+    time.sleep(0.05)
+    assert client.save_file('/musica/a.m3u', "nuevo")
+    assert client.read_file('/musica/a.m3u') == "nuevo"
+    reader.join()
+    assert len(dav.sent('GET')) == 2
+
+
+def test_followers_receive_leader_error(client):
+    def boom():
+        time.sleep(0.1)
+        raise KeyboardInterrupt
+    errors = []
+    def call():
+        try: client._single_flight(('GET', 'x'), boom)
+        except KeyboardInterrupt: errors.append(True)
+    run_parallel(4, call)
+    assert len(errors) == 4
+
+
+def test_concurrent_pops_return_distinct_tracks(client, dav):
+    dav.files['/musica/cola.m3u'] = b"#EXTM3U\n/musica/1.mp3\n/musica/2.mp3"
+    results = run_parallel(2, lambda: client.pop_first_from_m3u('/musica/cola.m3u'))
+    assert sorted(results) == ['/musica/1.mp3', '/musica/2.mp3']
+
+
+def test_store_membership_and_no_write_when_unchanged(client, dav):
+    dav.delay = 0
+    fav = client.favorites_file
+    assert client.append_to_m3u(fav, 'http://nas/musica/A/01%20x.mp3')
+    assert client.is_favorite_track('/musica/A/01 x.mp3')
+    assert client.append_line_to_file(client.fav_albums_file, '/musica/A/')
+    puts = len(dav.sent('PUT'))
+    assert client.append_line_to_file(client.fav_albums_file, '/musica/A')
+    assert len(dav.sent('PUT')) == puts
+    assert client.is_favorite_album('/musica/A/')
+
+
+def test_store_revalidates_with_etag(client, dav):
+    dav.delay = 0
+    path = server_path(client, client.history_file)
+    client.append_to_history('/musica/1.mp3')
+    assert client.store.get(client.history_file).etag == dav.etag(path)
+    dav.files[path] += b"\n/musica/externo.mp3"
+    assert '/musica/externo.mp3' in client.store.get(client.history_file).entries
+
+
+def test_writes_use_the_request_timeout(client, dav):
+    dav.delay = 0
+    client.append_to_history('/musica/1.mp3')
+    client.backend.save_bytes('/musica/manifiesto.json.gz', b"{}")
+    assert [r.timeout for r in dav.sent('PUT')] == [client.backend.timeout] * 2